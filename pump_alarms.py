@@ -0,0 +1,270 @@
+# %%
+import datetime
+import os
+import queue
+import subprocess
+import threading
+from collections import namedtuple
+from pump_logger import DEFAULT_LOG_DIR
+
+DEFAULT_ALARM_LOG = os.path.join(DEFAULT_LOG_DIR, 'pump_alarms.log')
+STALE_POLLS = 2  # pressure polls that may go missing before the data counts as stale
+
+# One alarm transition; state is 'raised' or 'cleared'.
+AlarmEvent = namedtuple('AlarmEvent', ['ts', 'name', 'severity', 'state', 'message', 'value'])
+
+
+class AlarmRule:
+    """Base rule: a condition with debounce.
+
+    observe() (per sample) and tick() (periodic) return True if the alarm
+    condition holds, False if it does not, or None if they cannot tell. The
+    alarm changes state only after the new condition has held for `debounce`
+    seconds; subclasses add hysteresis by testing against the current state.
+    """
+
+    def __init__(self, name, severity='warning', debounce=0.0):
+        self.name = name
+        self.severity = severity
+        self.debounce = debounce
+        self.active = False
+        self.value = None  # last value the condition was tested on
+        self._since = None  # when the condition first disagreed with `active`
+
+    def observe(self, snapshot):
+        return None
+
+    def tick(self, now):
+        return None
+
+    def restart(self, now):
+        """Monitoring (re)started at `now`."""
+
+    def message(self):
+        return self.name
+
+    def evaluate(self, condition, ts):
+        """Apply debounce to a condition result; returns an AlarmEvent on a state change."""
+        if condition is None:
+            return None
+        if condition == self.active:
+            self._since = None
+            return None
+        if self._since is None:
+            self._since = ts
+        if ts - self._since < self.debounce:
+            return None
+        self.active = condition
+        self._since = None
+        return AlarmEvent(ts, self.name, self.severity, 'raised' if condition else 'cleared',
+                          self.message(), self.value)
+
+
+class ThresholdRule(AlarmRule):
+    """Alarm while Snapshot field `field` is above `set_level` (or below, if `above` is False).
+
+    Once raised it clears only when the value is back past `clear_level`.
+    """
+
+    def __init__(self, name, field, set_level, clear_level, above=True, text=None, **kwargs):
+        super().__init__(name, **kwargs)
+        self.field = field
+        self.set_level = set_level
+        self.clear_level = clear_level
+        self.above = above
+        self.text = text or f"{field} {'above' if above else 'below'} {set_level:g}"
+
+    def observe(self, snapshot):
+        value = getattr(snapshot, self.field)
+        if value is None:
+            return None
+        self.value = value
+        level = self.clear_level if self.active else self.set_level
+        return value > level if self.above else value < level
+
+    def message(self):
+        return f"{self.text} ({self.value:g})"
+
+
+class TurboDropRule(AlarmRule):
+    """Alarm when the turbo falls below `drop_speed` after having reached `at_speed`.
+
+    A commanded stop (expect_stop()) disarms it until the turbo is back at speed.
+    """
+
+    def __init__(self, name='turbo_drop', at_speed=70000, drop_speed=65000, **kwargs):
+        super().__init__(name, **kwargs)
+        self.at_speed = at_speed
+        self.drop_speed = drop_speed
+        self.armed = False
+
+    def expect_stop(self):
+        self.armed = False
+
+    def observe(self, snapshot):
+        speed = snapshot.turbo_speed
+        if speed is None:
+            return None
+        self.value = speed
+        if speed >= self.at_speed:
+            self.armed = True
+            return False
+        if not self.armed:
+            return False  # spinning up, or stopped on purpose
+        return speed < self.drop_speed or (self.active and speed < self.at_speed)
+
+    def message(self):
+        return f"Turbo speed dropped to {self.value} rpm"
+
+
+class StaleRule(AlarmRule):
+    """Alarm when no pressure sample has arrived for `max_age` seconds while monitoring."""
+
+    def __init__(self, name='stale_data', max_age=10.0, **kwargs):
+        super().__init__(name, **kwargs)
+        self.max_age = max_age
+        self.last = None  # time of the last pressure sample; None while not monitoring
+
+    def restart(self, now):
+        self.last = now
+
+    def observe(self, snapshot):
+        if snapshot.pressure is None:
+            return None
+        self.last = snapshot.ts
+        return False
+
+    def tick(self, now):
+        if self.last is None:
+            return None
+        self.value = now - self.last
+        return self.value > self.max_age
+
+    def message(self):
+        return f"No pressure data for {self.value:.0f} s"
+
+
+def stale_after_for(max_period, minimum=10.0):
+    """Stale-data threshold (seconds) when pressure is polled at most every `max_period` s.
+
+    It must stay well above the slowest poll period (e.g. AdaptiveRate's
+    max_period), or the alarm raises and clears on every poll.
+    """
+    return max(minimum, STALE_POLLS * max_period)
+
+
+def default_rules(pressure_limit=1e-4, tipseal_limit=5000, stale_after=stale_after_for(10.0)):
+    """The standard rule set; pressure_limit is in the pump's units.
+
+    Pass stale_after=stale_after_for(slowest pressure period) when polling
+    can be slower than 10 s.
+    """
+    return [
+        ThresholdRule('pressure_high', 'pressure', pressure_limit, pressure_limit / 2, debounce=5.0,
+                      text=f"Pressure above {pressure_limit:g}"),
+        TurboDropRule(severity='critical', debounce=2.0),
+        ThresholdRule('tipseal_hours', 'tipseal_life', tipseal_limit, tipseal_limit - 100,
+                      text=f"Tip seal life over {tipseal_limit} hours; please change the tip seal"),
+        StaleRule(max_age=stale_after, severity='critical'),
+    ]
+
+
+class AlarmEngine:
+    """Evaluates alarm rules on each sample and hands transitions to sinks.
+
+    Sinks are callables taking an AlarmEvent (e.g. a GUI banner, AlarmLog,
+    AlarmHook); they must not block. A sink that raises is reported and
+    skipped, so alerting never interrupts sampling.
+    """
+
+    def __init__(self, rules=None, sinks=()):
+        self.rules = default_rules() if rules is None else list(rules)
+        self.sinks = list(sinks)
+
+    def rule(self, name):
+        return next(r for r in self.rules if r.name == name)
+
+    def active(self):
+        return [r for r in self.rules if r.active]
+
+    def update(self, snapshot):
+        """Evaluate every rule on one Snapshot; returns the transitions."""
+        return self._deliver(r.evaluate(r.observe(snapshot), snapshot.ts) for r in self.rules)
+
+    def check(self, now):
+        """Evaluate time-based rules (stale data); call periodically."""
+        return self._deliver(r.evaluate(r.tick(now), now) for r in self.rules)
+
+    def restart(self, now):
+        """Monitoring started: the stale-data clock starts now."""
+        for r in self.rules:
+            r.restart(now)
+
+    def suspend(self, now):
+        """Monitoring stopped: clear time-based alarms and stop checking them."""
+        events = []
+        for r in self.rules:
+            if isinstance(r, StaleRule):
+                r.last = None
+                if r.active:
+                    r.active = False
+                    events.append(AlarmEvent(now, r.name, r.severity, 'cleared', "Monitoring stopped", r.value))
+        return self._deliver(events)
+
+    def _deliver(self, events):
+        events = [e for e in events if e is not None]
+        for event in events:
+            for sink in self.sinks:
+                try:
+                    sink(event)
+                except Exception as e:
+                    print(f"Error delivering alarm {event.name}: {e}")
+        return events
+
+
+class AlarmLog:
+    """Appends alarm transitions to a text log, one line each."""
+
+    def __init__(self, path=DEFAULT_ALARM_LOG):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def __call__(self, event):
+        stamp = datetime.datetime.fromtimestamp(event.ts).isoformat(timespec='seconds')
+        with open(self.path, 'a') as f:
+            f.write(f"{stamp}  {event.state.upper():7s}  {event.severity:8s}  {event.name}: {event.message}\n")
+
+
+class AlarmHook:
+    """Runs a local command (or callable) for each alarm transition on a background thread.
+
+    A command gets the event in PUMP_ALARM_* environment variables; a string
+    is run through the shell. Slow or failing hooks never block the caller.
+    """
+
+    def __init__(self, command, timeout=60.0):
+        self.command = command
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="pump-alarm-hook", daemon=True)
+        self._thread.start()
+
+    def __call__(self, event):
+        self._queue.put(event)
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            try:
+                if callable(self.command):
+                    self.command(event)
+                    continue
+                env = dict(os.environ,
+                           PUMP_ALARM_NAME=event.name, PUMP_ALARM_STATE=event.state,
+                           PUMP_ALARM_SEVERITY=event.severity, PUMP_ALARM_MESSAGE=event.message,
+                           PUMP_ALARM_VALUE='' if event.value is None else str(event.value),
+                           PUMP_ALARM_TIME=str(event.ts))
+                subprocess.run(self.command, shell=isinstance(self.command, str), env=env,
+                               timeout=self.timeout, check=False)
+            except Exception as e:
+                print(f"Alarm hook failed for {event.name}: {e}")
@@ -0,0 +1,168 @@
+# %%
+import math
+from collections import deque, namedtuple
+
+# Latest analytics; fields are None until there is enough data.
+#   rate: pump-down rate of log10(pressure) in decades per minute (negative while pumping down)
+#   tau: exponential time constant in seconds implied by `rate`
+#   time_to_target: seconds until `target` is reached at the current rate (0 once below it)
+#   ror: rate of rise in pressure units per second while the turbo is stopped, over ror_seconds
+PumpdownStats = namedtuple('PumpdownStats', [
+    'ts', 'pressure', 'rate', 'tau', 'r2', 'target', 'time_to_target',
+    'ror', 'ror_seconds', 'ror_r2', 'min_pressure', 'max_pressure',
+])
+
+
+class SlidingFit:
+    """Least-squares line y = a + b*t over the samples of the last `span` seconds.
+
+    Keeps running sums that are updated as samples enter and leave the window,
+    so each add() is O(1) amortised instead of a rescan. Times are stored
+    relative to an origin that is moved forward now and then to keep the sums
+    well conditioned. span=None keeps every sample since the last clear().
+    """
+
+    def __init__(self, span=None):
+        self.span = span
+        self._samples = deque()  # (t - origin, y)
+        self._origin = None
+        self._clear_sums()
+
+    def _clear_sums(self):
+        self._n = 0
+        self._st = self._sy = self._stt = self._sty = self._syy = 0.0
+
+    def __len__(self):
+        return self._n
+
+    def clear(self):
+        self._samples.clear()
+        self._origin = None
+        self._clear_sums()
+
+    def _rebase(self, origin):
+        """Move the time origin and recompute the sums from the window (rare)."""
+        shift = self._origin - origin
+        samples = [(t + shift, y) for t, y in self._samples]
+        self._samples = deque(samples)
+        self._origin = origin
+        self._clear_sums()
+        for t, y in samples:
+            self._add(t, y, 1)
+
+    def _add(self, t, y, sign):
+        self._n += sign
+        self._st += sign * t
+        self._sy += sign * y
+        self._stt += sign * t * t
+        self._sty += sign * t * y
+        self._syy += sign * y * y
+
+    def add(self, t, y):
+        if self._origin is None:
+            self._origin = t
+        elif self.span is not None and t - self._origin > 10 * self.span:
+            self._rebase(self._samples[0][0] + self._origin if self._samples else t)
+        rel = t - self._origin
+        self._samples.append((rel, y))
+        self._add(rel, y, 1)
+        if self.span is not None:
+            while self._samples and self._samples[0][0] < rel - self.span:
+                old_t, old_y = self._samples.popleft()
+                self._add(old_t, old_y, -1)
+
+    def duration(self):
+        """Seconds covered by the samples in the window."""
+        return self._samples[-1][0] - self._samples[0][0] if self._samples else 0.0
+
+    def fit(self):
+        """(slope, value of the line at the newest sample, r^2), or None with < 3 points or no spread in t."""
+        n = self._n
+        if n < 3:
+            return None
+        var_t = n * self._stt - self._st ** 2
+        if var_t <= 1e-12 * max(1.0, n * self._stt):
+            return None
+        cov = n * self._sty - self._st * self._sy
+        slope = cov / var_t
+        intercept = (self._sy - slope * self._st) / n
+        var_y = n * self._syy - self._sy ** 2
+        r2 = cov * cov / (var_t * var_y) if var_y > 0 else 1.0
+        return slope, intercept + slope * self._samples[-1][0], min(1.0, r2)
+
+
+class PumpAnalytics:
+    """Pump-down and rate-of-rise figures updated from each sample.
+
+    The pump-down fit is a SlidingFit of log10(pressure) over the last `span`
+    seconds. Rate of rise is a linear fit of pressure over the last
+    `ror_span` seconds since the turbo speed fell to `stopped_speed` or below
+    (or since the first reading, if it was already stopped), and is cleared
+    once it spins up again. A change of pressure units starts everything over.
+    """
+
+    def __init__(self, span=60.0, target=1e-6, stopped_speed=0, ror_span=600.0):
+        self.span = span
+        self.target = target  # pressure in the pump's current units
+        self.stopped_speed = stopped_speed  # rpm at or below which the turbo counts as stopped
+        self.pumpdown = SlidingFit(span)
+        self.rise = SlidingFit(ror_span)
+        self.stats = None  # latest PumpdownStats
+        self._units = None
+        self._turbo = None
+        self._rising = False
+        self._min = self._max = None
+
+    def reset(self):
+        self.pumpdown.clear()
+        self.rise.clear()
+        self.stats = None
+        self._turbo = None
+        self._rising = False
+        self._min = self._max = None
+
+    def update(self, snapshot):
+        """Fold one Snapshot in; returns the new PumpdownStats (or the previous one if it had no pressure)."""
+        if snapshot.units is not None and snapshot.units != self._units:
+            if self._units is not None:
+                self.reset()
+            self._units = snapshot.units
+        if snapshot.turbo_speed is not None:
+            stopped = snapshot.turbo_speed <= self.stopped_speed
+            if stopped and (self._turbo is None or self._turbo > self.stopped_speed):
+                self.rise.clear()
+                self._rising = True
+            elif not stopped:
+                self._rising = False
+            self._turbo = snapshot.turbo_speed
+        pressure = snapshot.pressure
+        if pressure is None or pressure <= 0:
+            return self.stats
+        ts = snapshot.ts
+        self._min = pressure if self._min is None else min(self._min, pressure)
+        self._max = pressure if self._max is None else max(self._max, pressure)
+        self.pumpdown.add(ts, math.log10(pressure))
+        if self._rising:
+            self.rise.add(ts, pressure)
+
+        rate = tau = r2 = time_to_target = None
+        fit = self.pumpdown.fit()
+        if fit is not None:
+            slope, log_now, r2 = fit
+            rate = slope * 60.0
+            if slope < 0:
+                tau = -1.0 / (slope * math.log(10))
+            if self.target and self.target > 0:
+                remaining = math.log10(self.target) - log_now
+                if remaining >= 0:
+                    time_to_target = 0.0  # already there, even if the pressure has levelled off
+                elif slope < 0:
+                    time_to_target = remaining / slope
+        ror = ror_r2 = None
+        ror_seconds = self.rise.duration() if self._rising else None
+        rise = self.rise.fit() if self._rising else None
+        if rise is not None:
+            ror, _, ror_r2 = rise
+        self.stats = PumpdownStats(ts, pressure, rate, tau, r2, self.target, time_to_target,
+                                   ror, ror_seconds, ror_r2, self._min, self._max)
+        return self.stats
@@ -0,0 +1,313 @@
+# %%
+"""Benchmarks for the poll path, sample buffers and plot rendering.
+
+Runs against the in-process emulator (pump_emulator.LoopbackSerial), so no
+pump is needed. Results are written as JSON; pass --compare with an earlier
+result file to list regressions (exit code 1 if any):
+
+    python -m pump_bench --output bench.json
+    python -m pump_bench --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+import numpy as np
+import pump_helpers as helpers
+from pump_buffers import RingBuffer, DecimationPyramid
+from pump_emulator import PumpEmulator, PumpModel, LoopbackSerial
+from pump_watchdog import LoopMonitor
+
+FILLS = {'1h': 3600, '12h': 12 * 3600, '24h': 24 * 3600}  # seconds of 1 Hz samples
+HR_CAPACITY = 24 * 3600  # PumpGUI.hr at the default 1 s poll period
+PLOT_CAPACITY = 24 * 3600 // 5  # PumpGUI.plot_data at the default 5 s plot interval
+HELPERS = ('get_pressure_reading', 'get_pressure_units', 'get_turbo_speed', 'get_tipseal_life', 'get_pump_status')
+
+
+def measure(fn, repeat=200, warmup=5):
+    """Call `fn` `repeat` times and return timing stats in microseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - t0) / 1000.0)
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        'n': repeat,
+        'median_us': round(median, 3),
+        'p95_us': round(samples[min(repeat - 1, int(repeat * 0.95))], 3),
+        'max_us': round(samples[-1], 3),
+        'ops_per_s': round(1e6 / median, 1) if median else None,
+    }
+
+
+def _quiet(fn):
+    """Wrap `fn` so the legacy helpers' prints do not swamp the output or the timing."""
+    def call():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return call
+
+
+def bench_helpers(results, baud):
+    """Round trip of each single-value helper, with and without wire delay."""
+    for label, link_baud in (('loopback', 0), (f'{baud}baud', baud)):
+        ser = LoopbackSerial(PumpEmulator(PumpModel(running=True), baud=link_baud))
+        repeat = 200 if not link_baud else 20
+        for name in HELPERS:
+            fn = getattr(helpers, name)
+            results[f'helper.{name}.{label}'] = measure(_quiet(lambda: fn(ser)), repeat)
+        results[f'read_windows.pressure.{label}'] = measure(
+            lambda: helpers.read_windows(ser, ('pressure',)), repeat)
+        results[f'poll_cycle.snapshot.{label}'] = measure(lambda: helpers.poll_snapshot(ser), repeat)
+        results[f'poll_cycle.all_windows.{label}'] = measure(
+            lambda: helpers.poll_snapshot(ser, ('units', 'pressure', 'turbo_speed', 'tipseal_life')), repeat)
+
+
+def bench_decode(results):
+    """Reply validation and decoding alone (decode_reply)."""
+    ser = LoopbackSerial()
+    ser.write(helpers.READ_FRAMES['pressure'])
+    frame = helpers.read_frame(ser)
+    results['decode.pressure'] = measure(lambda: helpers.decode_reply('pressure', frame), 5000)
+    results['decode.pressure.cached'] = measure(lambda: helpers._decode_value('pressure', frame), 5000)
+    ser.write(helpers.READ_FRAMES['turbo_speed'])
+    frame_turbo = helpers.read_frame(ser)
+    results['decode.turbo_speed'] = measure(lambda: helpers.decode_reply('turbo_speed', frame_turbo), 5000)
+
+
+def _series(seconds, end):
+    """1 Hz pump-down-like (times, pressures, turbos) ending at `end`."""
+    times = np.arange(end - seconds, end, 1.0)
+    pressures = 1e-7 * (1 + 1e3 * np.exp(-(times - times[0]) / 3600.0)) * (1 + 0.05 * np.sin(times / 7.0))
+    turbos = np.full(len(times), 81000.0)
+    return times, pressures, turbos
+
+
+def bench_buffers(results):
+    """Ingest, update_plot aggregation and history loading at several buffer fills."""
+    now = time.time()
+    for label, seconds in FILLS.items():
+        times, pressures, turbos = _series(seconds, now)
+        hr = RingBuffer(HR_CAPACITY, ('pressure', 'turbo'))
+        hr.extend(times, pressures, turbos)
+        pyramid = DecimationPyramid()
+        pyramid.extend(times, pressures)
+        cutoff = now - 5.0  # PumpGUI.plot_interval
+        results[f'aggregate.plot_interval.{label}'] = measure(lambda: hr.aggregate('pressure', cutoff), 2000)
+        results[f'aggregate.full_window.{label}'] = measure(lambda: hr.aggregate('pressure'), 200)
+        results[f'pyramid.query_24h.{label}'] = measure(lambda: pyramid.query(now - 24 * 3600, now, 1000), 500)
+        results[f'history.extend.{label}'] = measure(
+            lambda: DecimationPyramid().extend(times, pressures), 10, warmup=1)
+
+    hr = RingBuffer(HR_CAPACITY, ('pressure', 'turbo'))
+    pyramid = DecimationPyramid()
+    clock = itertools.count()
+
+    def ingest():
+        # what PumpGUI.show_sample does with each pressure sample
+        ts = now + next(clock)
+        hr.append(ts, 1e-7, 81000.0)
+        pyramid.add(ts, 1e-7)
+
+    results['ingest.sample'] = measure(ingest, 20000)
+
+
+def bench_watchdog(results):
+    """What LoopMonitor adds to each Tk callback, and a status bar refresh."""
+    monitor = LoopMonitor()
+    root = SimpleNamespace(after=lambda ms, callback: callback())  # fire at once
+    results['watchdog.after_and_run'] = measure(lambda: monitor.after(root, 0, lambda: None, 'bench'), 20000)
+    results['watchdog.summary'] = measure(monitor.summary, 500)
+
+
+class PlotBench:
+    """The GUI's plot state on an off-screen Agg canvas, drawn by PumpGUI's own methods."""
+
+    def __init__(self, pyramid, view='24 h'):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        import matplotlib.dates as mdates
+        self.pyramid = pyramid
+        self.clock = time.time
+        self.renderer = None  # draw in-process, as PumpGUI does without render_process
+        self.render_mode = False
+        self.view_spans = {'1 h': 3600, '24 h': 24 * 3600, '7 d': 7 * 24 * 3600}
+        self.view_var = SimpleNamespace(get=lambda: view)  # stands in for the Tk StringVar
+        self.fig = Figure(figsize=(5, 4))
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.line, = self.ax.plot([], [], '-o', markersize=4, animated=True)
+        self._line_x = np.empty(4096)
+        self._line_y = np.empty(4096)
+        self._line_n = 0
+        self._line_key = None
+        self._line_tail = None
+        self._background = None
+        self.ax.xaxis_date()
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+        self.ax.set_yscale('log')
+        self.ax.grid(True)
+        self.canvas.mpl_connect('draw_event', self._on_plot_draw)
+
+    def invalidate(self):
+        self._line_key = None
+
+
+def bench_plot(results):
+    """PumpGUI.redraw_plot: full redraw vs incremental blit at several fills."""
+    try:
+        import pump_gui
+    except ImportError as e:
+        results['plot'] = {'skipped': str(e)}
+        return
+    if not pump_gui.HAS_MPL:
+        results['plot'] = {'skipped': 'matplotlib not installed'}
+        return
+    for name in ('redraw_plot', '_append_line', '_to_axis', '_rescale_plot', '_on_plot_draw', '_blit_line'):
+        setattr(PlotBench, name, getattr(pump_gui.PumpGUI, name))
+    now = time.time()
+    for label, seconds in FILLS.items():
+        times, pressures, _ = _series(seconds, now)
+        for view in ('1 h', '24 h'):
+            pyramid = DecimationPyramid()
+            pyramid.extend(times, pressures)
+            plot = PlotBench(pyramid, view)
+            tag = view.replace(' ', '')
+
+            def full():
+                plot.invalidate()
+                plot.redraw_plot()
+
+            results[f'plot.full_redraw.{tag}.{label}'] = measure(full, 20, warmup=2)
+
+            def incremental():
+                pyramid.add(time.time(), 1e-7)
+                plot.redraw_plot()
+
+            results[f'plot.incremental.{tag}.{label}'] = measure(incremental, 100, warmup=2)
+
+
+def bench_render(results):
+    """pump_render: the Agg render done off the Tk thread, and the full round trip through the process."""
+    try:
+        from pump_render import PlotRenderer, RenderRequest, RenderWorker
+        renderer = PlotRenderer()
+    except ImportError as e:
+        results['render'] = {'skipped': str(e)}
+        return
+    now = time.time()
+    times, pressures, turbos = _series(24 * 3600, now)
+    pyramid = DecimationPyramid()
+    pyramid.extend(times, pressures)
+    level = pyramid.choose_level(now - 24 * 3600, now, 1000)
+    starts, mins, maxs = pyramid.buckets(level, now - 24 * 3600, now)
+    series = (now - 24 * 3600, now, np.repeat(starts, 2), np.column_stack((mins, maxs)).ravel(),
+              times[::5], turbos[::5])
+    results['render.agg.24h'] = measure(
+        lambda: renderer.render(RenderRequest(0, 1000, 800, *series, 'mBar')), 10, warmup=1)
+    worker = RenderWorker()
+    try:
+        def round_trip():
+            seq = worker.submit(1000, 800, *series, 'mBar')
+            while True:
+                result = worker.results.get(timeout=30)
+                if result.seq == seq:
+                    return result
+
+        results['render.process_round_trip.24h'] = measure(round_trip, 10, warmup=1)
+        # what the Tk thread itself pays per redraw in render_process mode
+        results['render.submit.24h'] = measure(lambda: worker.submit(1000, 800, *series, 'mBar'), 10)
+    finally:
+        worker.close(timeout=5.0)
+
+
+def memory_stats(results):
+    """Peak RSS of this process and the footprint of full-size GUI buffers."""
+    hr = RingBuffer(HR_CAPACITY, ('pressure', 'turbo'))
+    plot_data = RingBuffer(PLOT_CAPACITY, ('pressure', 'turbo'))
+    pyramid = DecimationPyramid()
+    buffer_bytes = lambda buf: buf._times.nbytes + buf._values.nbytes
+    results['memory.buffers'] = {
+        'hr_bytes': buffer_bytes(hr),
+        'plot_data_bytes': buffer_bytes(plot_data),
+        'pyramid_bytes': sum(buffer_bytes(buf) for _, buf in pyramid.levels),
+    }
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        results['memory.peak_rss'] = {'bytes': peak if sys.platform == 'darwin' else peak * 1024}
+    except ImportError:
+        results['memory.peak_rss'] = {'skipped': 'resource module not available'}
+
+
+def run(baud=helpers.BAUD_RATE, plot=True):
+    results = {}
+    bench_helpers(results, baud)
+    bench_decode(results)
+    bench_buffers(results)
+    bench_watchdog(results)
+    if plot:
+        bench_plot(results)
+        bench_render(results)
+    memory_stats(results)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Names of benchmarks whose median got slower than `threshold` (fractional) vs baseline."""
+    regressions = []
+    for name, stats in current['results'].items():
+        old = baseline['results'].get(name, {})
+        if 'median_us' not in stats or not old.get('median_us'):
+            continue
+        ratio = stats['median_us'] / old['median_us']
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            print(f"REGRESSION {name}: {old['median_us']:.1f} -> {stats['median_us']:.1f} us ({ratio:.2f}x)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pump_bench", description="Pump monitor benchmarks")
+    parser.add_argument('--output', default=None, help="write JSON results to this file (default: stdout)")
+    parser.add_argument('--compare', default=None, help="earlier JSON results to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before flagging (default 0.25)")
+    parser.add_argument('--baud', type=int, default=helpers.BAUD_RATE, help="emulated line speed for the wire-delay runs")
+    parser.add_argument('--no-plot', action='store_true', help="skip the matplotlib benchmarks")
+    args = parser.parse_args(argv)
+
+    report = run(args.baud, plot=not args.no_plot)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    elif not args.compare:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(report, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
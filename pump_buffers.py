@@ -0,0 +1,226 @@
+# %%
+from collections import namedtuple
+import numpy as np
+
+# Summary of one column over a time window; mean/min/max are NaN if no valid values.
+Aggregate = namedtuple('Aggregate', ['count', 'mean', 'min', 'max'])
+
+
+class RingBuffer:
+    """Fixed-capacity float64 time series: one time column plus named value columns.
+
+    Storage is preallocated numpy arrays; once full, each append overwrites the
+    oldest sample. Missing values (None) are stored as NaN. Samples must be
+    appended in time order so the time column can be binary-searched.
+    """
+
+    def __init__(self, capacity, columns=('value',)):
+        self.capacity = int(capacity)
+        self.columns = tuple(columns)
+        self._times = np.empty(self.capacity)
+        self._values = np.full((len(self.columns), self.capacity), np.nan)
+        self._start = 0  # physical index of the oldest sample
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._start = 0
+        self._count = 0
+
+    def append(self, ts, *values):
+        """Add one sample; `values` are in `columns` order (None -> NaN)."""
+        if self._count < self.capacity:
+            i = (self._start + self._count) % self.capacity
+            self._count += 1
+        else:
+            i = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._times[i] = ts
+        self._values[:, i] = [np.nan if v is None else v for v in values]
+
+    def extend(self, times, *columns):
+        """Add many time-ordered samples at once; `columns` are arrays in `columns` order."""
+        times = np.asarray(times, dtype=float)
+        values = np.array([np.asarray(c, dtype=float) for c in columns]).reshape(len(self.columns), len(times))
+        n = len(times)
+        if n >= self.capacity:
+            self._times[:] = times[-self.capacity:]
+            self._values[:] = values[:, -self.capacity:]
+            self._start, self._count = 0, self.capacity
+            return
+        pos = (self._start + self._count) % self.capacity
+        first = min(n, self.capacity - pos)
+        self._times[pos:pos + first] = times[:first]
+        self._values[:, pos:pos + first] = values[:, :first]
+        self._times[:n - first] = times[first:]
+        self._values[:, :n - first] = values[:, first:]
+        overflow = self._count + n - self.capacity
+        if overflow > 0:
+            self._start = (self._start + overflow) % self.capacity
+            self._count = self.capacity
+        else:
+            self._count += n
+
+    def _segments(self):
+        """Physical (lo, hi) index ranges holding the samples, oldest first."""
+        end = self._start + self._count
+        if end <= self.capacity:
+            return [(self._start, end)]
+        return [(self._start, self.capacity), (0, end - self.capacity)]
+
+    def _index(self, ts):
+        """Logical index of the first sample with time >= ts."""
+        offset = 0
+        for lo, hi in self._segments():
+            i = int(np.searchsorted(self._times[lo:hi], ts))
+            if i < hi - lo:
+                return offset + i
+            offset += hi - lo
+        return offset
+
+    def _take(self, array, first, last):
+        """Logical samples [first, last) of `array`; a view unless the range wraps."""
+        lo = self._start + first
+        hi = self._start + last
+        if hi <= self.capacity:
+            return array[..., lo:hi]
+        if lo >= self.capacity:
+            return array[..., lo - self.capacity:hi - self.capacity]
+        return np.concatenate((array[..., lo:], array[..., :hi - self.capacity]), axis=-1)
+
+    def window(self, start=None, end=None):
+        """Return (times, values) for start <= t < end; values has one row per column."""
+        first = 0 if start is None else self._index(start)
+        last = self._count if end is None else self._index(end)
+        last = max(first, last)
+        return self._take(self._times, first, last), self._take(self._values, first, last)
+
+    def times(self):
+        return self.window()[0]
+
+    def column(self, name, start=None, end=None):
+        return self.window(start, end)[1][self.columns.index(name)]
+
+    def oldest_time(self):
+        """Time of the oldest sample, or None if empty."""
+        return float(self._times[self._start]) if self._count else None
+
+    def last(self):
+        """The newest (ts, values...) tuple, or None if empty."""
+        if not self._count:
+            return None
+        i = (self._start + self._count - 1) % self.capacity
+        return (float(self._times[i]), *(float(v) for v in self._values[:, i]))
+
+    def aggregate(self, name, start=None, end=None):
+        """Count/mean/min/max of column `name` over start <= t < end, ignoring NaN."""
+        values = self.column(name, start, end)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return Aggregate(0, np.nan, np.nan, np.nan)
+        return Aggregate(len(values), float(values.mean()), float(values.min()), float(values.max()))
+
+
+# (bucket width, retention) in seconds, finest first
+PYRAMID_LEVELS = (
+    (1, 2 * 3600),
+    (5, 24 * 3600),
+    (30, 3 * 24 * 3600),
+    (120, 8 * 24 * 3600),
+    (900, 90 * 24 * 3600),
+)
+
+
+class DecimationPyramid:
+    """Min/max summaries of one series at several bucket widths.
+
+    Every sample updates the open bucket of each level; a bucket is moved into
+    that level's RingBuffer once a sample lands in a later bucket. query()
+    picks the finest level that fits the requested number of points, so a
+    plot can show an hour or a week with about one bucket per pixel.
+    """
+
+    def __init__(self, levels=PYRAMID_LEVELS):
+        self.levels = [(width, RingBuffer(retention // width, ('min', 'max'))) for width, retention in levels]
+        self._open = [None] * len(self.levels)  # per level: [bucket start, min, max]
+
+    def clear(self):
+        for _, buf in self.levels:
+            buf.clear()
+        self._open = [None] * len(self.levels)
+
+    def add(self, ts, value):
+        """Fold one sample into every level (NaN is ignored)."""
+        if value != value:
+            return
+        for i, (width, buf) in enumerate(self.levels):
+            start = ts - ts % width
+            cur = self._open[i]
+            if cur is None or start > cur[0]:
+                if cur is not None:
+                    buf.append(*cur)
+                self._open[i] = [start, value, value]
+            else:
+                # same bucket (or a slightly late sample): widen the open bucket
+                cur[1] = min(cur[1], value)
+                cur[2] = max(cur[2], value)
+
+    def extend(self, times, values):
+        """Fold many time-ordered samples into every level at once (e.g. history from disk)."""
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values, dtype=float)
+        keep = ~np.isnan(values)
+        times, values = times[keep], values[keep]
+        if not len(times):
+            return
+        for i, (width, buf) in enumerate(self.levels):
+            starts = times - times % width
+            bounds = np.concatenate(([0], np.flatnonzero(np.diff(starts)) + 1))
+            bucket_starts = starts[bounds]
+            mins = np.minimum.reduceat(values, bounds)
+            maxs = np.maximum.reduceat(values, bounds)
+            cur = self._open[i]
+            if cur is not None:
+                if bucket_starts[0] <= cur[0]:
+                    # first new bucket continues the open one
+                    mins[0] = min(mins[0], cur[1])
+                    maxs[0] = max(maxs[0], cur[2])
+                    bucket_starts[0] = cur[0]
+                else:
+                    buf.append(*cur)
+            buf.extend(bucket_starts[:-1], mins[:-1], maxs[:-1])
+            self._open[i] = [float(bucket_starts[-1]), float(mins[-1]), float(maxs[-1])]
+
+    def choose_level(self, start, end, max_points):
+        """Index of the finest level that fits `max_points` buckets and still holds data back to `start`."""
+        for i, (width, buf) in enumerate(self.levels):
+            if (end - start) / width > max_points:
+                continue
+            if len(buf) < buf.capacity or buf.oldest_time() <= start:
+                return i
+        return len(self.levels) - 1
+
+    def buckets(self, level, start, end):
+        """(bucket starts, mins, maxs) of `level` for buckets starting in [start, end), incl. the open one."""
+        _, buf = self.levels[level]
+        times, values = buf.window(start, end)
+        mins, maxs = values
+        cur = self._open[level]
+        if cur is not None and start <= cur[0] < end:
+            times = np.append(times, cur[0])
+            mins = np.append(mins, cur[1])
+            maxs = np.append(maxs, cur[2])
+        return times, mins, maxs
+
+    def query(self, start, end, max_points):
+        """Return (times, values) covering [start, end] in at most ~max_points buckets.
+
+        Each bucket contributes its min and max at the bucket centre, so spikes
+        survive decimation. Uses the level picked by choose_level().
+        """
+        level = self.choose_level(start, end, max_points)
+        width = self.levels[level][0]
+        times, mins, maxs = self.buckets(level, start - width, end)
+        return np.repeat(times + width / 2, 2), np.column_stack((mins, maxs)).ravel()
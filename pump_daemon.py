@@ -0,0 +1,158 @@
+# %%
+"""Headless pump logger: python -m pump_daemon [--gui]
+
+Runs the acquisition worker, sample store and CSV logger without Tkinter or
+matplotlib, so it starts quickly on a logging box. Pass --gui to open the
+normal monitor window instead (GUI modules are only imported then).
+"""
+import argparse
+import os
+import queue
+import signal
+import sys
+import time
+from pump_worker import AcquisitionWorker
+from pump_store import TimeSeriesStore, DEFAULT_DIR
+from pump_logger import StreamLogger, DEFAULT_LOG_DIR
+from pump_metrics import DEFAULT_METRICS_PATH
+from pump_trace import DEFAULT_TRACE_DIR, TRACE, TRACE_SECONDS, capacity_for
+from pump_alarms import AlarmEngine, AlarmLog, AlarmHook, default_rules, stale_after_for
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pump_daemon", description="Headless cryostation pump logger")
+    parser.add_argument('--gui', action='store_true', help="open the Tk monitor window instead of running headless")
+    parser.add_argument('--port', default=None,
+                        help="serial port of the pump, or a pump_server URL such as socket://127.0.0.1:5760 "
+                             "(default: a running pump_server, the cached port, then probe all ports)")
+    parser.add_argument('--interval', type=float, default=1.0, help="pressure poll period in seconds (default 1)")
+    parser.add_argument('--turbo-interval', type=float, default=5.0, help="turbo speed poll period in seconds (default 5)")
+    parser.add_argument('--tip-interval', type=float, default=3600.0, help="tip seal life poll period in seconds (default 3600)")
+    parser.add_argument('--adaptive', action='store_true', help="poll faster while pressure/turbo are changing")
+    parser.add_argument('--data-dir', default=DEFAULT_DIR, help="binary sample store directory")
+    parser.add_argument('--log-dir', default=DEFAULT_LOG_DIR, help="CSV log directory")
+    parser.add_argument('--metrics-file', default=DEFAULT_METRICS_PATH,
+                        help="Prometheus text file with link metrics, rewritten every 5 s ('' to disable)")
+    parser.add_argument('--trace-hours', type=float, default=TRACE_SECONDS / 3600,
+                        help=f"hours of link traffic the in-memory wire trace holds at the poll periods given "
+                             f"(default {TRACE_SECONDS / 3600:g})")
+    parser.add_argument('--trace-dir', default=DEFAULT_TRACE_DIR,
+                        help="where wire traces are dumped after a poll error or on SIGUSR1 ('' to disable)")
+    parser.add_argument('--pressure-alarm', type=float, default=1e-4,
+                        help="raise an alarm above this pressure, in the pump's units (default 1e-4)")
+    parser.add_argument('--alarm-hook', default=None,
+                        help="shell command run for each alarm change (PUMP_ALARM_* environment variables)")
+    parser.add_argument('--print-interval', type=float, default=10.0,
+                        help="seconds between status lines on the console (0 = every sample)")
+    parser.add_argument('--duration', type=float, default=None, help="stop after this many seconds")
+    return parser.parse_args(argv)
+
+
+def run_gui(port=None):
+    import tkinter as tk
+    from pump_gui import PumpGUI
+    root = tk.Tk()
+    PumpGUI(root, port=port)
+    root.mainloop()
+
+
+def run_headless(args):
+    """Poll and log until interrupted (or for --duration seconds). Returns an exit code."""
+    periods = {
+        'pressure': args.interval,
+        'turbo_speed': args.turbo_interval,
+        'units': None,  # only on connect/start or after an error
+        'tipseal_life': args.tip_interval,
+    }
+    # a TX and an RX record per read; adaptive fast polling fills it quicker than this
+    rate = 2 * sum(1 / period for period in periods.values() if period)
+    capacity = capacity_for(args.trace_hours * 3600, rate)
+    if capacity != TRACE.capacity:
+        TRACE.resize(capacity)
+    worker = AcquisitionWorker(periods, adaptive={} if args.adaptive else None,
+                               store=TimeSeriesStore(args.data_dir), logger=StreamLogger(args.log_dir),
+                               port=args.port, metrics_path=args.metrics_file or None,
+                               trace_dir=args.trace_dir or None)
+    def print_alarm(event):
+        print(f"{time.strftime('%H:%M:%S')}  ALARM {event.state}: {event.name}: {event.message}")
+
+    sinks = [print_alarm, AlarmLog(os.path.join(args.log_dir, 'pump_alarms.log'))]
+    if args.alarm_hook:
+        sinks.append(AlarmHook(args.alarm_hook))
+    slowest = max(args.interval, worker.adaptive.max_period) if args.adaptive else args.interval
+    alarms = AlarmEngine(default_rules(pressure_limit=args.pressure_alarm, stale_after=stale_after_for(slowest)), sinks)
+    stop = []
+    # SIGTERM (service stop) shuts down as cleanly as Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.append(signum))
+    if hasattr(signal, 'SIGUSR1'):
+        # kill -USR1 <pid> dumps the wire trace (POSIX only)
+        signal.signal(signal.SIGUSR1, lambda signum, frame: worker.submit('dump_trace'))
+    started = time.monotonic()
+    worker.start()
+    worker.submit('connect')
+    worker.submit('start_monitoring')
+    alarms.restart(time.time())
+    last_print = None
+    units = None
+    turbo = None
+    try:
+        while not stop:
+            if args.duration is not None and time.monotonic() - started >= args.duration:
+                break
+            alarms.check(time.time())  # stale data
+            try:
+                kind, payload = worker.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            match kind:
+                case 'connected':
+                    alarms.update(payload)
+                    units = payload.units
+                    print(f"Connected ({time.monotonic() - started:.2f} s); units: {units or 'not detected'}")
+                case 'connect_error':
+                    print(f"Failed to connect to pump: {payload}")
+                case 'link_state':
+                    match payload['state']:
+                        case 'degraded':
+                            print(f"{time.strftime('%H:%M:%S')}  link degraded: {payload['error']}")
+                        case 'reconnecting':
+                            print(f"{time.strftime('%H:%M:%S')}  reconnecting in {payload['retry_in']:.1f} s: {payload['error']}")
+                        case 'connected':
+                            print(f"{time.strftime('%H:%M:%S')}  link up")
+                case 'sample':
+                    alarms.update(payload)
+                    units = payload.units or units
+                    if payload.turbo_speed is not None:
+                        turbo = payload.turbo_speed
+                    if last_print is None:
+                        print(f"First sample {time.monotonic() - started:.2f} s after start")
+                    now = time.monotonic()
+                    if payload.failed:
+                        print(f"{time.strftime('%H:%M:%S')}  no reply for {', '.join(payload.failed)}")
+                    elif last_print is None or now - last_print >= args.print_interval:
+                        last_print = now
+                        print(f"{time.strftime('%H:%M:%S')}  {payload.pressure_text or '--'} {units or ''}  "
+                              f"turbo {'--' if turbo is None else turbo} rpm")
+                case 'poll_error':
+                    print(f"{time.strftime('%H:%M:%S')}  poll error: {payload}")
+                case 'trace_dumped':
+                    if payload['path']:
+                        print(f"{time.strftime('%H:%M:%S')}  wire trace ({payload['reason']}) saved to {payload['path']}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.submit('close')
+        worker.join(timeout=5.0)
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.gui:
+        run_gui(args.port)
+        return 0
+    return run_headless(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+# %%
+"""Software stand-in for the Agilent TPS-compact controller.
+
+Speaks the same STX/address/window/CRC protocol as pump_helpers over a local
+pseudo-terminal (Linux/macOS) or a TCP socket, so the GUI, daemon and
+benchmarks can run without the hardware:
+
+    python -m pump_emulator                   # prints a /dev/pts/N path
+    python -m pump_daemon --port /dev/pts/N
+
+With --tcp PORT, connect with serial.serial_for_url('socket://localhost:PORT').
+"""
+import argparse
+import math
+import os
+import random
+import socket
+import threading
+import time
+from pump_helpers import (STX, ETX, ACK, NAK, ADDRESS, READ, WRITE, BAUD_RATE, READ_TIMEOUT, WINDOWS,
+                          _crc_chars, _format_data)
+from pump_scheduler import BITS_PER_CHAR
+
+# Controller error codes sent in place of ACK/NAK
+UNKNOWN_WINDOW = b'\x32'
+DATA_TYPE_ERROR = b'\x33'
+WINDOW_DISABLED = b'\x35'
+
+PASCAL_PER_MBAR = 100.0
+TORR_PER_MBAR = 0.750062
+
+
+class PumpModel:
+    """Window values of a simulated pump, driven by a simple pump-down curve.
+
+    While running, log(pressure) relaxes from its value at start towards
+    `base_pressure` with time constant `tau` and the turbo spins up linearly
+    over `spin_up` seconds. After a stop the pressure rises at `rise_rate`
+    mbar/s (up to atmosphere) and the turbo coasts down over `spin_down`.
+    Tip seal hours accrue while running. Pressure is kept in mbar and
+    converted to the units in window 163 when read.
+    """
+
+    def __init__(self, start_pressure=1000.0, base_pressure=5e-8, tau=60.0, rise_rate=1e-3,
+                 full_speed=81000, spin_up=120.0, spin_down=300.0, tipseal_hours=1200.0,
+                 running=False, clock=time.monotonic):
+        self.base_pressure = base_pressure
+        self.tau = tau
+        self.rise_rate = rise_rate
+        self.full_speed = full_speed
+        self.spin_up = spin_up
+        self.spin_down = spin_down
+        self.clock = clock
+        self.units = 0  # 0 mBar, 1 Pascal, 2 Torr
+        self.serial_mode = 1  # front panel until the host writes window 008
+        self.speed_after_stop = 0
+        self.tipseal_hours = tipseal_hours
+        self.running = running
+        self._t0 = clock()
+        self._p0 = start_pressure
+        self._s0 = full_speed if running else 0.0
+        self._lock = threading.Lock()
+
+    def _state(self, now):
+        """(pressure in mbar, turbo rpm) at monotonic time `now`."""
+        dt = max(0.0, now - self._t0)
+        if self.running:
+            decay = math.exp(-dt / self.tau)
+            pressure = self.base_pressure * (self._p0 / self.base_pressure) ** decay
+            speed = min(self.full_speed, self._s0 + self.full_speed * dt / self.spin_up)
+        else:
+            pressure = min(1000.0, self._p0 + self.rise_rate * dt)
+            speed = max(0.0, self._s0 - self.full_speed * dt / self.spin_down)
+        return pressure, speed
+
+    def _set_running(self, running):
+        if running == self.running:
+            return
+        now = self.clock()
+        self._p0, self._s0 = self._state(now)
+        if self.running:
+            self.tipseal_hours += (now - self._t0) / 3600
+        self._t0 = now
+        self.running = running
+
+    def pressure(self):
+        """Pressure in the current units."""
+        with self._lock:
+            mbar = self._state(self.clock())[0]
+        match self.units:
+            case 1: return mbar * PASCAL_PER_MBAR
+            case 2: return mbar * TORR_PER_MBAR
+            case _: return mbar
+
+    def read(self, name):
+        """Current value of window `name` as written in its data field."""
+        with self._lock:
+            now = self.clock()
+            match name:
+                case 'start_stop': return int(self.running)
+                case 'serial_mode': return self.serial_mode
+                case 'units': return self.units
+                case 'speed_after_stop': return self.speed_after_stop
+                case 'turbo_speed': return round(self._state(now)[1])
+                case 'tipseal_life':
+                    hours = self.tipseal_hours
+                    if self.running:
+                        hours += (now - self._t0) / 3600
+                    return int(hours)
+        if name == 'pressure':
+            return f"{self.pressure():.1E}"
+        raise KeyError(name)
+
+    def write(self, name, value):
+        """Apply a write; returns ACK or a controller error code."""
+        with self._lock:
+            match name:
+                case 'start_stop':
+                    if self.serial_mode != 0:
+                        return WINDOW_DISABLED
+                    self._set_running(bool(value))
+                case 'serial_mode': self.serial_mode = value
+                case 'units':
+                    if value not in (0, 1, 2):
+                        return DATA_TYPE_ERROR
+                    self.units = value
+                case 'speed_after_stop': self.speed_after_stop = value
+                case 'tipseal_life':
+                    self.tipseal_hours = value
+                    if self.running:
+                        # restart the hour count without disturbing the curve
+                        now = self.clock()
+                        self._p0, self._s0 = self._state(now)
+                        self._t0 = now
+                case _: return WINDOW_DISABLED
+        return ACK
+
+
+class PumpEmulator:
+    """Answers command frames from a PumpModel, with optional link impairments.
+
+    Each reply is delayed by its time on the wire at `baud` plus up to
+    `jitter` seconds, and every reply byte is dropped with probability
+    `drop_rate`. Frames for another `address` are ignored, and a frame with a
+    bad CRC is answered with NAK, as the controller does.
+    """
+
+    def __init__(self, model=None, address=ADDRESS, baud=BAUD_RATE, jitter=0.0, drop_rate=0.0, seed=None):
+        self.model = PumpModel() if model is None else model
+        self.address = address
+        self.baud = baud  # None or 0 = no wire delay
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.by_number = {b'%03d' % w.number: name for name, w in WINDOWS.items()}
+        self.frames = 0  # frames answered
+        self._buffer = bytearray()
+        self._running = False
+        self._threads = []
+        self._closers = []
+
+    def _reply(self, code):
+        body = bytes([self.address]) + code + ETX
+        return STX + body + _crc_chars(body)
+
+    def handle(self, frame):
+        """Reply bytes for one complete command frame (b'' if it is not for us)."""
+        if len(frame) < 9 or frame[1] != self.address:
+            return b''
+        body = frame[1:-2]
+        if _crc_chars(body) != frame[-2:]:
+            return self._reply(NAK)
+        number, rw, data = bytes(frame[2:5]), bytes(frame[5:6]), bytes(frame[6:-3])
+        name = self.by_number.get(number)
+        if name is None:
+            return self._reply(UNKNOWN_WINDOW)
+        window = WINDOWS[name]
+        if rw == READ:
+            if data or 'R' not in window.access:
+                return self._reply(DATA_TYPE_ERROR)
+            value = _format_data(window, self.model.read(name))
+            body = bytes([self.address]) + number + READ + value + ETX
+            return STX + body + _crc_chars(body)
+        if rw != WRITE or 'W' not in window.access or len(data) != window.length:
+            return self._reply(DATA_TYPE_ERROR)
+        try:
+            value = int(data) if window.dtype in 'LN' else data.decode('ascii')
+        except ValueError:
+            return self._reply(DATA_TYPE_ERROR)
+        return self._reply(self.model.write(name, value))
+
+    def feed(self, data):
+        """Consume received bytes; returns the replies to every frame they complete."""
+        self._buffer += data
+        out = bytearray()
+        while True:
+            start = self._buffer.find(STX)
+            if start < 0:
+                self._buffer.clear()
+                break
+            end = self._buffer.find(ETX, start + 1)
+            if end < 0 or len(self._buffer) < end + 3:
+                del self._buffer[:start]
+                break
+            frame = bytes(self._buffer[start:end + 3])
+            del self._buffer[:end + 3]
+            reply = self.handle(frame)
+            if reply:
+                self.frames += 1
+                out += self._impair(frame, reply)
+        return bytes(out)
+
+    def _impair(self, frame, reply):
+        delay = 0.0
+        if self.baud:
+            delay += (len(frame) + len(reply)) * BITS_PER_CHAR / self.baud
+        if self.jitter:
+            delay += self.random.uniform(0.0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if self.drop_rate:
+            reply = bytes(b for b in reply if self.random.random() >= self.drop_rate)
+        return reply
+
+    def _serve(self, recv, send):
+        while self._running:
+            try:
+                data = recv()
+            except OSError:
+                return
+            if not data:
+                if data is None:
+                    continue
+                return
+            reply = self.feed(data)
+            if reply:
+                send(reply)
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, name="pump-emulator", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def start_pty(self):
+        """Serve on a new pseudo-terminal; returns the device path to open as the port."""
+        import select
+        import tty
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        path = os.ttyname(slave)
+        self._closers += [lambda: os.close(master), lambda: os.close(slave)]
+
+        def recv():
+            # poll so stop() is noticed; None means "nothing yet"
+            if not select.select([master], [], [], 0.2)[0]:
+                return None
+            return os.read(master, 4096)
+
+        self._running = True
+        self._spawn(self._serve, recv, lambda data: os.write(master, data))
+        return path
+
+    def start_tcp(self, host='127.0.0.1', port=0):
+        """Serve one client at a time on a TCP socket; returns (host, port)."""
+        server = socket.create_server((host, port))
+        server.settimeout(0.2)
+        self._closers.append(server.close)
+
+        def accept_loop():
+            while self._running:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                except OSError:
+                    return
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._buffer.clear()
+                with conn:
+                    self._serve(lambda: conn.recv(4096), conn.sendall)
+
+        self._running = True
+        self._spawn(accept_loop)
+        return server.getsockname()[:2]
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        for close in self._closers:
+            try:
+                close()
+            except OSError:
+                pass
+        self._threads.clear()
+        self._closers.clear()
+
+
+class LoopbackSerial:
+    """In-process stand-in for serial.Serial connected to a PumpEmulator.
+
+    Replies are computed synchronously on write(), so there is no pty or
+    socket in the path; useful for benchmarks and for platforms without ptys.
+    read() waits out `timeout` when nothing is buffered, like a real port.
+    """
+
+    def __init__(self, emulator=None, port='loop://pump', timeout=READ_TIMEOUT):
+        self.emulator = PumpEmulator(baud=0) if emulator is None else emulator
+        self.port = port
+        self.baudrate = self.emulator.baud or BAUD_RATE
+        self.timeout = timeout
+        self.is_open = True
+        self._rx = bytearray()
+
+    @property
+    def in_waiting(self):
+        return len(self._rx)
+
+    def write(self, data):
+        self._rx += self.emulator.feed(bytes(data))
+        return len(data)
+
+    def read(self, size=1):
+        if not self._rx:
+            if self.timeout:
+                time.sleep(self.timeout)
+            return b''
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pump_emulator", description="Emulated TPS-compact pump controller")
+    parser.add_argument('--tcp', type=int, default=None, metavar='PORT', help="serve on a TCP port instead of a pty")
+    parser.add_argument('--baud', type=int, default=BAUD_RATE, help="simulated line speed (0 = no wire delay)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random reply delay, up to this many seconds")
+    parser.add_argument('--drop', type=float, default=0.0, help="probability of dropping each reply byte")
+    parser.add_argument('--running', action='store_true', help="start with the pump already running at full speed")
+    parser.add_argument('--start-pressure', type=float, default=1000.0, help="initial pressure in mbar")
+    parser.add_argument('--base-pressure', type=float, default=5e-8, help="ultimate pressure in mbar")
+    parser.add_argument('--tau', type=float, default=60.0, help="pump-down time constant in seconds")
+    parser.add_argument('--rise-rate', type=float, default=1e-3, help="pressure rise after stop in mbar/s")
+    parser.add_argument('--seed', type=int, default=None, help="random seed for jitter and drops")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    model = PumpModel(start_pressure=args.start_pressure, base_pressure=args.base_pressure,
+                      tau=args.tau, rise_rate=args.rise_rate, running=args.running)
+    emulator = PumpEmulator(model, baud=args.baud, jitter=args.jitter, drop_rate=args.drop, seed=args.seed)
+    if args.tcp is None:
+        print(f"Emulated pump on {emulator.start_pty()}")
+    else:
+        host, port = emulator.start_tcp(port=args.tcp)
+        print(f"Emulated pump on socket://{host}:{port}")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
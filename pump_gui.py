@@ -1,13 +1,24 @@
 # %%
 import tkinter as tk
 from tkinter import ttk, messagebox
-import threading
+import queue
 import time
 import csv
 import datetime
-from collections import deque
+import os
+import argparse
 from tkinter import filedialog
-from pump_helpers import open_comm, close_comm, get_pressure_reading, get_pressure_units, get_turbo_speed, start_pump, stop_pump, get_tipseal_life, get_pump_status
+from pump_worker import AcquisitionWorker
+from pump_helpers import ADDRESS
+from pump_store import TimeSeriesStore, load_recent, DEFAULT_DIR
+from pump_buffers import RingBuffer, DecimationPyramid
+from pump_logger import StreamLogger, DEFAULT_LOG_DIR
+from pump_metrics import DEFAULT_METRICS_PATH
+from pump_analytics import PumpAnalytics
+from pump_alarms import AlarmEngine, AlarmLog, AlarmHook, default_rules, stale_after_for
+from pump_render import RenderWorker
+from pump_watchdog import LoopMonitor, ProfileCapture
+import numpy as np
 try:
     import matplotlib
     matplotlib.use('Agg')
@@ -19,47 +30,179 @@ except Exception:
     HAS_MPL = False
 
 
+def _format_duration(seconds):
+    if seconds < 120:
+        return f"{seconds:.0f} s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+class LoopStatusBar:
+    """Bottom status bar: event-loop lag of the window's callbacks and a profiling toggle.
+
+    The owner of the Tk loops schedules them through `monitor` and calls
+    tick() from its drain loop, which also stops a profile capture whose
+    time is up. The report path is shown in the bar, not a dialog,
+    so profiling never blocks the loop it measures.
+    """
+
+    def __init__(self, parent, monitor, profiler, profile_seconds=30, refresh_interval=1.0):
+        self.monitor = monitor
+        self.profiler = profiler
+        self.refresh_interval = refresh_interval  # seconds between label updates
+        self.lag_warning_ms = 250  # p95 lag above this is shown in red
+        self._refreshed = 0.0
+        self.frame = ttk.Frame(parent, relief="sunken", padding=(6, 2))
+        self.frame.pack(side="bottom", fill="x")
+        self.label = ttk.Label(self.frame, text="Event loop: --", font=("Arial", 9), foreground="gray")
+        self.label.pack(side="left")
+        self.profile_button = ttk.Button(self.frame, text="Profile", command=self.toggle_profile)
+        self.profile_button.pack(side="right")
+        ttk.Label(self.frame, text="s", font=("Arial", 9)).pack(side="right", padx=(2, 6))
+        self.profile_seconds = tk.IntVar(value=profile_seconds)
+        ttk.Spinbox(self.frame, from_=5, to=600, increment=5, width=4,
+                    textvariable=self.profile_seconds).pack(side="right")
+        self.profile_label = ttk.Label(self.frame, text="", font=("Arial", 9), foreground="gray")
+        self.profile_label.pack(side="right", padx=(0, 10))
+
+    def toggle_profile(self):
+        if self.profiler.running:
+            self._profiled(self.profiler.stop)
+            return
+        try:
+            seconds = max(1, int(self.profile_seconds.get()))
+        except (tk.TclError, ValueError):
+            seconds = 30
+        try:
+            self.profiler.start(seconds)
+        except ValueError as e:
+            # another profiler is already active on this thread
+            self.profile_label.config(text=f"Cannot profile: {e}", foreground="red")
+            return
+        self.profile_button.config(text="Stop Profile")
+        self.profile_label.config(text=f"Profiling for {seconds} s...", foreground="goldenrod")
+
+    def _profiled(self, finish):
+        self.profile_button.config(text="Profile")
+        try:
+            path = finish()
+        except Exception as e:
+            self.profile_label.config(text=f"Profile failed: {e}", foreground="red")
+            return
+        if path:
+            self.profile_label.config(text=f"Profile saved to {path}", foreground="gray")
+
+    def tick(self):
+        """Finish a due profile capture and refresh the lag text (at most every refresh_interval)"""
+        if self.profiler.due():
+            self._profiled(self.profiler.stop)
+        now = time.monotonic()
+        if now - self._refreshed < self.refresh_interval:
+            return
+        self._refreshed = now
+        parts = []
+        worst = 0.0
+        for name, m in self.monitor.summary().items():
+            parts.append(f"{name} lag p50 {m['lag_p50_ms']:.0f} / p95 {m['lag_p95_ms']:.0f} / "
+                         f"max {m['lag_max_ms']:.0f} ms, runs p95 {m['run_p95_ms']:.0f} ms")
+            worst = max(worst, m['lag_p95_ms'])
+        if self.monitor.stalls:
+            ts, name, lag, previous, previous_run = self.monitor.stalls[-1]
+            parts.append(f"last stall {time.strftime('%H:%M:%S', time.localtime(ts))} ({lag:.1f} s)")
+        self.label.config(text="Event loop: " + ("  |  ".join(parts) or "--"),
+                          foreground="red" if worst > self.lag_warning_ms else "gray")
+
+
 class PumpGUI:
-    def __init__(self, root):
+    def __init__(self, root, replay=None, port=None, address=ADDRESS, name=None, parent=None, close_command=None,
+                 render_process=False):
         self.root = root
-        self.root.title("Cryostation Pump Monitor")
-        self.root.state('zoomed')  # Maximize window on startup
-        self.root.resizable(True, True)
+        # port: serial port or pump_server URL (socket://host:port); None = discover
+        self.port = port
+        self.address = address  # pump address byte (pumps sharing an RS-485 port differ here)
+        # name: this pump's label when several are monitored; data and logs go in a subfolder of that name
+        self.name = name
+        # parent: frame to build the panel in (a MultiPumpGUI tab), which then drives its loops
+        self.embedded = parent is not None
+        self.container = root if parent is None else parent
+        self.close_command = close_command or self.close_app
+        # replay: a pump_replay.TraceReplay to show instead of the live pump
+        self.replay = replay
+        self.clock = time.time if replay is None else replay.clock  # wall clock, or the replay's
+        if not self.embedded:
+            self.root.title("Cryostation Pump Monitor" if replay is None else f"Cryostation Pump Monitor (replay of {replay.path})")
+            self.root.state('zoomed')  # Maximize window on startup
+            self.root.resizable(True, True)
         
-        self.ser = None
+        self.worker = None  # AcquisitionWorker; owns the serial port
+        self.connected = False
         self.monitoring = False
-        self.update_interval = 1000  # milliseconds
+        self.update_interval = 1000  # milliseconds between pressure polls (worker thread)
+        self.turbo_interval = 5000  # milliseconds between turbo speed polls
+        # adaptive sampling: poll faster while pressure/turbo change, back off at steady state
+        self.min_update_interval = 250  # milliseconds; fastest pressure poll
+        self.max_update_interval = 10000  # milliseconds; slowest pressure poll
+        self.drain_interval = 100  # milliseconds between draining worker events on the Tk loop
         self.plot_interval = 5000  # milliseconds (5 seconds)
-        # compute deque sizes so they represent ~24 hours of data
+        # compute buffer sizes so they represent ~24 hours of data
         # plot samples are taken every `plot_interval`; hr samples every `update_interval`
         try:
             self.plot_maxlen = int(24 * 3600 / (self.plot_interval / 1000.0))
         except Exception:
             # fallback to 5s-sampled 24h (~17280)
             self.plot_maxlen = 17280
-        self.times = deque(maxlen=self.plot_maxlen)
-        self.prices = deque(maxlen=self.plot_maxlen)
-        self.turbo_values = deque(maxlen=self.plot_maxlen)
-        # high-resolution sample buffers (collected every update_interval)
+        # plot points: plot_interval averages of the high-resolution samples
+        self.plot_data = RingBuffer(self.plot_maxlen, ('pressure', 'turbo'))
+        # high-resolution sample buffer (collected every update_interval); turbo is NaN if unknown
         try:
             hr_maxlen = int(24 * 3600 / (self.update_interval / 1000.0))
         except Exception:
             hr_maxlen = 86400
-        self.hr_times = deque(maxlen=hr_maxlen)
-        self.hr_pressures = deque(maxlen=hr_maxlen)
-        self.hr_turbos = deque(maxlen=hr_maxlen)
-        # tip seal sampling: sample interval (seconds) and last sample timestamp
+        self.hr = RingBuffer(hr_maxlen, ('pressure', 'turbo'))
+        # min/max pressure summaries at several resolutions; the plot draws from these
+        self.pyramid = DecimationPyramid()
+        # pump-down rate / time-to-target / rate-of-rise, updated from every sample
+        self.analytics = PumpAnalytics(span=60.0, target=1e-6)
+        self.view_spans = {'1 h': 3600, '24 h': 24 * 3600, '7 d': 7 * 24 * 3600}  # seconds
+        # tip seal sampling interval (seconds); sampled by the worker
         self.tip_sample_interval = 3600  # 1 hour
-        self.tip_last_sample_ts = None
-        self.tip_seal_warning_shown = False
         self.last_pressure_value = None
+        self.last_turbo_value = None  # turbo is polled less often; held for the hr buffer
         self.plot_callback = None
         self.pending_callback = None  # Track pending callbacks
+        self.data_dir = DEFAULT_DIR if name is None else os.path.join(DEFAULT_DIR, name)  # on-disk sample store (pump_store.py)
+        self.log_dir = DEFAULT_LOG_DIR if name is None else os.path.join(DEFAULT_LOG_DIR, name)  # full-resolution CSV logs (pump_logger.py)
+        self.metrics_path = DEFAULT_METRICS_PATH  # Prometheus text file of link metrics (None to disable)
+        # alarms: shown in a banner, appended to a log and optionally passed to a local command
+        self.alarm_hook = None  # e.g. "notify-send pump \"$PUMP_ALARM_MESSAGE\"" (see pump_alarms.AlarmHook)
+        sinks = [self.on_alarm]
+        if replay is None:
+            sinks.append(AlarmLog(os.path.join(self.log_dir, 'pump_alarms.log')))
+        if self.alarm_hook:
+            sinks.append(AlarmHook(self.alarm_hook))
+        # stale data: judged against the slowest pressure poll, with or without adaptive sampling
+        slowest = max(self.update_interval, self.max_update_interval) / 1000.0
+        self.alarms = AlarmEngine(default_rules(pressure_limit=1e-4, tipseal_limit=5000,
+                                                stale_after=stale_after_for(slowest)), sinks)
+        # render_process: draw the plot (pressure and turbo) in a pump_render process; Tk only shows the image
+        self.render_process = render_process
+        self.renderer = None  # RenderWorker while render_process is on
+        # the plot area shows rendered images; stays True if the render process dies (there is no figure to fall back to)
+        self.render_mode = False
+        # event-loop lag of update_pressure/update_plot, shown in the status bar; profiles go to pump_profiles/
+        self.loop_monitor = LoopMonitor()
+        self.profiler = ProfileCapture(monitor=self.loop_monitor)
+        self.loop_status = None  # LoopStatusBar; a MultiPumpGUI has one for the whole window
         
         self.setup_ui()
+        if replay is None:
+            self.load_history()
         self.connect_pump()
-        # Handle window close button (X)
-        self.root.protocol("WM_DELETE_WINDOW", self.close_app)
+        if not self.embedded:
+            self.update_pressure()
+            # Handle window close button (X)
+            self.root.protocol("WM_DELETE_WINDOW", self.close_app)
 
         
     def setup_ui(self):
@@ -69,8 +212,14 @@ class PumpGUI:
         style.configure('TButton', font=('Arial', 12))
         
         # Main split: left = controls/display, right = plot
-        main_frame = ttk.Frame(self.root)
+        # alarm banner: packed above everything while any alarm is active (see on_alarm)
+        self.alarm_banner = tk.Label(self.container, text="", font=("Arial", 12, "bold"), anchor="w", padx=10, pady=4)
+        if not self.embedded:
+            self.loop_status = LoopStatusBar(self.container, self.loop_monitor, self.profiler)
+
+        main_frame = ttk.Frame(self.container)
         main_frame.pack(fill="both", expand=True)
+        self.main_frame = main_frame
 
         left_frame = ttk.Frame(main_frame)
         left_frame.pack(side="left", fill="both", expand=True, padx=8, pady=8)
@@ -82,7 +231,7 @@ class PumpGUI:
         title_frame = ttk.Frame(left_frame)
         title_frame.pack(pady=10)
 
-        title_label = ttk.Label(title_frame, text="Pump Pressure Monitor", 
+        title_label = ttk.Label(title_frame, text="Pump Pressure Monitor" if self.name is None else f"Pump Pressure Monitor: {self.name}",
                                 font=("Arial", 16, "bold"))
         title_label.pack()
         author_label = ttk.Label(title_frame, text="Written by: Jerry A. Yang",
@@ -100,6 +249,18 @@ class PumpGUI:
                                       foreground="red", font=("Arial", 10))
         self.status_label.pack()
 
+        self.link_label = ttk.Label(status_frame, text="Link: --",
+                                    foreground="gray", font=("Arial", 9))
+        self.link_label.pack()
+
+        self.adaptive_var = tk.BooleanVar(value=False)
+        adaptive_check = ttk.Checkbutton(status_frame, text="Adaptive sampling",
+                                         variable=self.adaptive_var, command=self.toggle_adaptive)
+        adaptive_check.pack()
+
+        trace_button = ttk.Button(status_frame, text="Dump Wire Trace", command=self.dump_trace)
+        trace_button.pack(pady=(5, 0))
+
         # Pressure display frame
         pressure_frame = ttk.LabelFrame(left_frame, text="Pressure Reading", padding=20)
         pressure_frame.pack(padx=10, pady=10, fill="both", expand=True, side="top")
@@ -131,11 +292,74 @@ class PumpGUI:
                            font=("Arial", 12))
         self.tipseal_label.pack()
 
+        # Link diagnostics: per-window transaction metrics from pump_metrics, refreshed with link stats
+        diag_frame = ttk.LabelFrame(right_frame, text="Link Diagnostics", padding=5)
+        diag_frame.pack(side="bottom", fill="x", pady=(8, 0))
+        columns = ('count', 'p50', 'p95', 'max', 'timeout', 'nak', 'crc', 'error', 'bytes')
+        headings = ('Count', 'p50 ms', 'p95 ms', 'Max ms', 'Timeouts', 'NAKs', 'CRC', 'Errors', 'Bytes tx/rx')
+        self.diag_tree = ttk.Treeview(diag_frame, columns=columns, height=6)
+        self.diag_tree.heading('#0', text='Window')
+        self.diag_tree.column('#0', width=130, stretch=False)
+        for column, heading in zip(columns, headings):
+            self.diag_tree.heading(column, text=heading)
+            self.diag_tree.column(column, width=70, anchor='e')
+        self.diag_tree.pack(fill="x")
+
+        # Pump-down analytics (pump_analytics.PumpAnalytics)
+        analytics_frame = ttk.LabelFrame(left_frame, text="Pump-down Analytics", padding=10)
+        analytics_frame.pack(padx=10, pady=10, fill="x", side="top")
+
+        self.rate_label = ttk.Label(analytics_frame, text="Pump-down: --", font=("Arial", 11))
+        self.rate_label.pack(anchor="w")
+
+        target_frame = ttk.Frame(analytics_frame)
+        target_frame.pack(anchor="w")
+        ttk.Label(target_frame, text="Target:", font=("Arial", 11)).pack(side="left")
+        self.target_var = tk.StringVar(value=f"{self.analytics.target:g}")
+        ttk.Entry(target_frame, textvariable=self.target_var, width=8).pack(side="left", padx=4)
+        self.target_label = ttk.Label(target_frame, text="--", font=("Arial", 11))
+        self.target_label.pack(side="left")
+
+        self.ror_label = ttk.Label(analytics_frame, text="Rate of rise: --", font=("Arial", 11))
+        self.ror_label.pack(anchor="w")
+
         # Chart area on right_frame (matplotlib)
         self.plot_canvas = None
+        if HAS_MPL and self.render_process:
+            try:
+                self.renderer = RenderWorker()
+            except Exception as e:
+                print(f"Could not start the plot render process, drawing in the GUI: {e}")
         if HAS_MPL:
+            # time span selector
+            self.view_var = tk.StringVar(value='24 h')
+            view_frame = ttk.Frame(right_frame)
+            view_frame.pack(fill='x')
+            ttk.Label(view_frame, text="View:").pack(side='left')
+            for name in self.view_spans:
+                ttk.Radiobutton(view_frame, text=name, value=name, variable=self.view_var,
+                                command=self.redraw_plot).pack(side='left', padx=4)
+
+        if HAS_MPL and self.renderer is not None:
+            # images from the render process are shown on a plain Tk canvas
+            self.render_mode = True
+            self.plot_view = tk.Canvas(right_frame, highlightthickness=0, background='white')
+            self.plot_view.pack(fill='both', expand=True)
+            self.plot_image_item = self.plot_view.create_image(0, 0, anchor='nw')
+            self.plot_photo = None
+            self._render_size = None
+            self.canvas_widget = self.plot_view
+            self.plot_view.bind('<Configure>', self._on_plot_resize)
+        elif HAS_MPL:
             self.fig, self.ax = plt.subplots(figsize=(5, 4))
-            self.line, = self.ax.plot([], [], '-o', markersize=4)
+            # the line is animated: it is blitted over a cached background of the axes
+            self.line, = self.ax.plot([], [], '-o', markersize=4, animated=True)
+            self._line_x = np.empty(4096)  # axis units, converted once per bucket
+            self._line_y = np.empty(4096)
+            self._line_n = 0
+            self._line_key = None  # (view, pyramid level) the line arrays were built for
+            self._line_tail = None  # start time of the last (still open) bucket drawn
+            self._background = None
             self.ax.set_title('Pressure vs Time')
             self.ax.set_xlabel('Time')
             self.ax.set_ylabel('Pressure')
@@ -157,6 +381,7 @@ class PumpGUI:
             self.canvas = FigureCanvasTkAgg(self.fig, master=right_frame)
             self.canvas_widget = self.canvas.get_tk_widget()
             self.canvas_widget.pack(fill='both', expand=True)
+            self.canvas.mpl_connect('draw_event', self._on_plot_draw)
         else:
             msg = ttk.Label(right_frame, text='matplotlib not installed; plot unavailable', foreground='gray')
             msg.pack(padx=10, pady=10)
@@ -186,7 +411,7 @@ class PumpGUI:
         self.stop_button.pack(side="left", padx=5, fill="both", expand=True, ipady=15)
         
         close_button = ttk.Button(control_frame, text="Close", 
-                      command=self.close_app)
+                      command=self.close_command)
         close_button.pack(side="left", padx=5, fill="both", expand=True, ipady=15)
         
         save_button = ttk.Button(control_frame, text="Save Plot CSV",
@@ -194,71 +419,147 @@ class PumpGUI:
         save_button.pack(side="left", padx=5, fill="both", expand=True, ipady=15)
         
     def connect_pump(self):
-        """Establish serial connection to pump"""
-        try:
-            self.ser = open_comm()
-            units = get_pressure_units(self.ser)
-            units_norm = str(units).strip().lower().rstrip('.')
-            if units_norm == "get units failed":
-                self.status_label.config(text="Disconnected", foreground="red")
-                messagebox.showwarning("Connection Status", "Pump not detected (units read failed).")
-                return
+        """Start the acquisition worker and ask it to open the pump connection"""
+        if self.replay is not None:
+            # the replay stands in for the worker; nothing is stored or logged
+            self.worker = self.replay
+            self.worker.start()
+            self.worker.submit('connect')
+            return
+        periods = {
+            'pressure': self.update_interval / 1000.0,
+            'turbo_speed': self.turbo_interval / 1000.0,
+            'units': None,  # only on connect/start or after an error
+            'tipseal_life': self.tip_sample_interval,
+        }
+        adaptive = {'min_period': self.min_update_interval / 1000.0,
+                    'max_period': self.max_update_interval / 1000.0}
+        self.worker = AcquisitionWorker(periods, adaptive=adaptive, port=self.port, address=self.address, name=self.name,
+                                        store=TimeSeriesStore(self.data_dir), logger=StreamLogger(self.log_dir),
+                                        metrics_path=self.metrics_path)
+        self.worker.adaptive_enabled = self.adaptive_var.get()
+        self.worker.start()
+        self.worker.submit('connect')
 
-            self.status_label.config(text="Connected", foreground="green")
-            # sample tip seal life immediately on successful connection
-            try:
-                tip_life = get_tipseal_life(self.ser)
-                if tip_life is None:
-                    self.tipseal_label.config(text="Tip Seal Life: -- hr", foreground="black")
-                else:
-                    self.tipseal_label.config(text=f"Tip Seal Life: {tip_life} hr")
-                    if tip_life > 5000:
-                        self.tipseal_label.config(foreground="red")
-                        if not self.tip_seal_warning_shown:
-                            messagebox.showwarning("Tip Seal Warning", "Tip seal life is over 5000 hours. Please change the tip seal.")
-                            self.tip_seal_warning_shown = True
-                    else:
-                        self.tipseal_label.config(foreground="black")
-                self.tip_last_sample_ts = time.time()
-            except Exception:
-                # leave label as-is on error
-                pass
+    def load_history(self):
+        """Refill the buffers and plot from the on-disk store after a restart"""
+        try:
+            times, pressures, turbos = load_recent(max(self.view_spans.values()), self.data_dir)
         except Exception as e:
-            messagebox.showerror("Connection Error", f"Failed to connect to pump:\n{str(e)}")
-            self.status_label.config(text="Connection Failed", foreground="red")
-            
+            print(f"Error loading stored history: {e}")
+            return
+        self.pyramid.extend(times, pressures)
+        recent = times >= time.time() - 24 * 3600
+        times, pressures, turbos = times[recent], pressures[recent], turbos[recent]
+        if len(times):
+            self.hr.extend(times, pressures, turbos)
+            # rebuild the plot buffers as plot_interval averages, as update_plot would have
+            bucket = self.plot_interval / 1000.0
+            index = (times - times[0]) // bucket
+            bounds = np.concatenate(([0], np.flatnonzero(np.diff(index)) + 1))
+            counts = np.diff(np.append(bounds, len(times)))
+            known = ~np.isnan(turbos)
+            turbo_counts = np.add.reduceat(known, bounds)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                turbo_means = np.add.reduceat(np.where(known, turbos, 0.0), bounds) / turbo_counts
+            self.plot_data.extend(times[0] + (index[bounds] + 1) * bucket,
+                                  np.add.reduceat(pressures, bounds) / counts,
+                                  np.where(turbo_counts > 0, turbo_means, np.nan))
+        self.redraw_plot()
+
+    def dump_trace(self):
+        """Ask the worker to write its wire trace (every frame sent and received) to a file"""
+        if self.worker:
+            self.worker.submit('dump_trace')
+
+    def on_trace_dumped(self, result):
+        if result['reason'] != 'manual':
+            if result['path']:
+                print(f"Wire trace saved to {result['path']}")
+            return
+        if result['error']:
+            messagebox.showerror("Wire Trace", f"Failed to save wire trace:\n{result['error']}")
+        else:
+            messagebox.showinfo("Wire Trace", f"Saved wire trace to {result['path']}\n\n"
+                                              f"Replay it with: python -m pump_replay \"{result['path']}\"")
+
+    def toggle_adaptive(self):
+        """Switch the worker between adaptive and fixed poll rates"""
+        if self.worker:
+            self.worker.submit('set_adaptive', self.adaptive_var.get())
+
+    def on_connected(self, snapshot):
+        """Handle the worker's result for the connect command"""
+        self.connected = True
+        if snapshot.units is None:
+            self.status_label.config(text="Disconnected", foreground="red")
+            messagebox.showwarning("Connection Status", "Pump not detected (units read failed).")
+            return
+
+        self.status_label.config(text="Connected", foreground="green")
+        self.units_label.config(text=snapshot.units)
+        self.show_tip_life(snapshot.tipseal_life)
+        self.alarms.update(snapshot)
+
+    def on_connect_error(self, message):
+        messagebox.showerror("Connection Error", f"Failed to connect to pump:\n{message}\n\n"
+                                                 "Retrying in the background.")
+        self.status_label.config(text="Connection Failed", foreground="red")
+
+    def show_link_state(self, info):
+        """Show the worker's connection state; buffers and plot are kept through an outage"""
+        match info['state']:
+            case 'connected':
+                self.status_label.config(text="Connected", foreground="green")
+            case 'degraded':
+                self.status_label.config(text=f"Degraded ({info['failures']} missed)", foreground="goldenrod")
+            case 'reconnecting':
+                self.status_label.config(text=f"Reconnecting (retry in {info['retry_in']:.1f} s)", foreground="red")
+
+    def show_tip_life(self, tip_life):
+        """Update the tip seal label from a tip seal life reading (the alarm engine does the warning)"""
+        try:
+            if tip_life is None:
+                self.tipseal_label.config(text="Tip Seal Life: -- hr", foreground="black")
+            else:
+                self.tipseal_label.config(text=f"Tip Seal Life: {tip_life} hr")
+                over = tip_life > self.alarms.rule('tipseal_hours').set_level
+                self.tipseal_label.config(foreground="red" if over else "black")
+        except Exception:
+            # leave label as-is on error
+            pass
+
+    def on_alarm(self, event):
+        """Alarm engine sink: show the active alarms in the banner (never blocks the Tk loop)"""
+        print(f"Alarm {event.state}: {event.name}: {event.message}")
+        active = self.alarms.active()
+        if not active:
+            self.alarm_banner.pack_forget()
+            return
+        critical = any(r.severity == 'critical' for r in active)
+        self.alarm_banner.config(text="  |  ".join(r.message() for r in active),
+                                 background="red" if critical else "orange",
+                                 foreground="white" if critical else "black")
+        if not self.alarm_banner.winfo_ismapped():
+            self.alarm_banner.pack(fill="x", before=self.main_frame)
+
     def start_monitoring(self):
         """Start continuous pressure monitoring"""
-        if self.ser is None:
+        if not self.connected:
             messagebox.showwarning("Warning", "Pump not connected")
             return
         
         self.monitoring = True
         self.start_button.config(state="disabled")
         self.stop_button.config(state="normal")
-        # clear plot data so plot starts fresh on each monitoring session
-        try:
-            self.times.clear()
-            self.prices.clear()
-            self.hr_times.clear()
-            self.hr_pressures.clear()
-            self.hr_turbos.clear()
-            self.last_pressure_value = None
-            self.tip_last_sample_ts = None
-            if HAS_MPL:
-                self.line.set_data([], [])
-                self.ax.relim()
-                self.ax.autoscale_view()
-                try:
-                    self.canvas.draw_idle()
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        # history is kept across sessions (and restarts, via the store); only drop stale values
+        self.last_pressure_value = None
+        self.last_turbo_value = None
 
-        self.update_pressure()
-        # start plot sampling loop (5s)
-        if HAS_MPL:
+        self.worker.submit('start_monitoring')
+        self.alarms.restart(self.clock())
+        # start plot sampling loop (5s); a MultiPumpGUI runs one loop for all its panels
+        if HAS_MPL and not self.embedded:
             # cancel existing if present
             if self.plot_callback:
                 try:
@@ -270,6 +571,9 @@ class PumpGUI:
     def stop_monitoring(self):
         """Stop continuous pressure monitoring"""
         self.monitoring = False
+        if self.worker:
+            self.worker.submit('stop_monitoring')
+        self.alarms.suspend(self.clock())
         self.start_button.config(state="normal")
         self.stop_button.config(state="disabled")
         # cancel plot callback
@@ -281,137 +585,184 @@ class PumpGUI:
             self.plot_callback = None
         
     def update_pressure(self):
-        """Update pressure reading from pump"""
+        """Drain worker events every drain_interval"""
         self.pending_callback = None  # Clear callback reference
-        if self.monitoring and self.ser:
-            try:
-                units = get_pressure_units(self.ser)
-                units_norm = str(units).strip().lower().rstrip('.')
-                if units_norm == "get units failed":
-                    self.status_label.config(text="Disconnected", foreground="red")
-                    self.pressure_label.config(text="--", foreground="red")
-                    self.units_label.config(text="--")
+        self.drain_events()
+        self.loop_status.tick()
+        self.pending_callback = self.loop_monitor.after(self.root, self.drain_interval, self.update_pressure)
+
+    def drain_events(self):
+        """Handle the events published by the acquisition worker and update the display"""
+        if self.worker:
+            while True:
+                try:
+                    kind, payload = self.worker.events.get_nowait()
+                except queue.Empty:
+                    break
+                match kind:
+                    case 'sample':
+                        if self.monitoring:
+                            self.show_sample(payload)
+                    case 'poll_error':
+                        if self.monitoring:
+                            self.show_poll_error(payload)
+                    case 'link_stats': self.show_link_stats(payload)
+                    case 'connected': self.on_connected(payload)
+                    case 'connect_error': self.on_connect_error(payload)
+                    case 'link_state': self.show_link_state(payload)
+                    case 'start_pump': self.on_start_pump_result(payload)
+                    case 'stop_pump': self.on_stop_pump_result(payload)
+                    case 'trace_dumped': self.on_trace_dumped(payload)
+                    case 'replay_done': self.status_label.config(text="Replay finished", foreground="gray")
+        if self.monitoring:
+            self.alarms.check(self.clock())  # stale data
+        if self.renderer is not None:
+            self.show_rendered_plot()
+
+    def show_sample(self, snapshot):
+        """Update labels and high-resolution buffers from one worker snapshot.
+
+        Only the windows that were due are set; the others are None and keep
+        their previous display. Windows in `snapshot.failed` are shown as
+        unknown, while the ones that did answer are still recorded.
+        """
+        self.alarms.update(snapshot)
+        values = (snapshot.units, snapshot.pressure, snapshot.turbo_speed, snapshot.tipseal_life)
+        if all(value is None for value in values):
+            if snapshot.failed:
+                self.status_label.config(text="Disconnected", foreground="red")
+        elif snapshot.failed:
+            self.status_label.config(text=f"Connected ({', '.join(snapshot.failed)} failed)", foreground="goldenrod")
+        else:
+            self.status_label.config(text="Connected", foreground="green")
+        for name in snapshot.failed:
+            match name:
+                case 'pressure': self.pressure_label.config(text="--", foreground="red")
+                case 'units': self.units_label.config(text="--")
+                case 'turbo_speed':
                     self.turbo_label.config(text="Turbo: -- rpm")
                     self.turbo_status_label.config(text="--", foreground="gray")
-                    if self.monitoring:
-                        self.pending_callback = self.root.after(self.update_interval, self.update_pressure)
-                    return
+                case 'tipseal_life': self.show_tip_life(None)
 
-                self.status_label.config(text="Connected", foreground="green")
-                pressure = get_pressure_reading(self.ser)
-                turbo = get_turbo_speed(self.ser)
-                
-                self.pressure_label.config(text=pressure, foreground="blue")
-                self.units_label.config(text=units)
-                self.turbo_label.config(text=f"Turbo: {turbo} rpm")
-                turbo_value = self._parse_pressure_value(turbo)
-                if turbo_value is not None and turbo_value > 70000:
-                    self.turbo_status_label.config(text="At Speed", foreground="green")
-                elif turbo_value is not None and turbo_value == 0:
-                    self.turbo_status_label.config(text="Stopped", foreground="red")
-                elif turbo_value is not None and 0 < turbo_value <= 70000:
-                    self.turbo_status_label.config(text="Starting/Stopping", foreground="goldenrod")
-                else:
-                    self.turbo_status_label.config(text="--", foreground="gray")
-                # read tip seal life from device if available (once per hour)
-                try:
-                    now_ts = time.time()
-                    if (self.tip_last_sample_ts is None) or (now_ts - self.tip_last_sample_ts >= self.tip_sample_interval):
-                        tip_life = get_tipseal_life(self.ser)
-                        if tip_life is None:
-                            self.tipseal_label.config(text="Tip Seal Life: -- hr", foreground="black")
-                        else:
-                            self.tipseal_label.config(text=f"Tip Seal Life: {tip_life} hr")
-                            if tip_life > 5000:
-                                self.tipseal_label.config(foreground="red")
-                                if not self.tip_seal_warning_shown:
-                                    messagebox.showwarning("Tip Seal Warning", "Tip seal life is over 5000 hours. Please change the tip seal.")
-                                    self.tip_seal_warning_shown = True
-                            else:
-                                self.tipseal_label.config(foreground="black")
-                        self.tip_last_sample_ts = now_ts
-                except Exception:
-                    # keep previous value on error
-                    pass
-                # parse numeric pressure for plotting
-                num = self._parse_pressure_value(pressure)
-                if num is not None:
-                    self.last_pressure_value = num
-                    # record high-resolution sample
-                    ts = time.time()
-                    self.hr_times.append(ts)
-                    self.hr_pressures.append(num)
-                    # parse turbo numeric if possible
-                    tnum = self._parse_pressure_value(turbo)
-                    # always append to hr_turbos to keep buffers aligned (use None if missing)
-                    if tnum is not None:
-                        self.hr_turbos.append(tnum)
-                    else:
-                        self.hr_turbos.append(None)
-                
-            except Exception as e:
-                self.pressure_label.config(text="Error", foreground="red")
-                self.units_label.config(text=str(e))
-                self.turbo_label.config(text="Turbo: Error")
-                self.turbo_status_label.config(text="--", foreground="red")
-                print(f"Error reading pressure: {e}")
-            
-            # Schedule next update only if still monitoring
-            if self.monitoring:
-                self.pending_callback = self.root.after(self.update_interval, self.update_pressure)
+        if snapshot.units is not None:
+            self.units_label.config(text=snapshot.units)
+        if snapshot.pressure_text is not None:
+            self.pressure_label.config(text=snapshot.pressure_text, foreground="blue")
+        turbo_value = snapshot.turbo_speed
+        if turbo_value is not None:
+            self.last_turbo_value = turbo_value
+            self.turbo_label.config(text=f"Turbo: {turbo_value} rpm")
+            if turbo_value > 70000:
+                self.turbo_status_label.config(text="At Speed", foreground="green")
+            elif turbo_value == 0:
+                self.turbo_status_label.config(text="Stopped", foreground="red")
+            else:
+                self.turbo_status_label.config(text="Starting/Stopping", foreground="goldenrod")
+        # tip seal life is only included in a snapshot when the worker re-read it (once per hour)
+        if snapshot.tipseal_life is not None:
+            self.show_tip_life(snapshot.tipseal_life)
+        if snapshot.pressure is not None:
+            self.last_pressure_value = snapshot.pressure
+            # record high-resolution sample with the latest turbo reading
+            self.hr.append(snapshot.ts, snapshot.pressure, self.last_turbo_value)
+            self.pyramid.add(snapshot.ts, snapshot.pressure)
+        self.show_analytics(self.analytics.update(snapshot))
 
-    def do_start_pump(self):
-        """Send start command to the pump"""
-        if self.ser is None:
-            messagebox.showwarning("Warning", "Pump not connected")
-            return
-        # Check pump status via get_pump_status()
+    def show_analytics(self, stats):
+        """Show pump-down rate, time to the target pressure and rate of rise"""
         try:
-            try:
-                status = get_pump_status(self.ser)
-            except Exception as e:
-                messagebox.showerror("Pump Status Error", f"Failed to read pump status:\n{e}")
-                return
+            target = float(self.target_var.get())
+            if target > 0:
+                self.analytics.target = target
+        except ValueError:
+            pass  # keep the previous target while the entry is being edited
+        if stats is None:
+            return
+        units = self.units_label.cget('text')
+        if stats.rate is None:
+            self.rate_label.config(text="Pump-down: --")
+        else:
+            tau = "" if stats.tau is None else f", tau {_format_duration(stats.tau)}"
+            self.rate_label.config(text=f"Pump-down: {stats.rate:+.3f} decades/min{tau} (r² {stats.r2:.2f})")
+        if stats.time_to_target is None:
+            self.target_label.config(text="not converging")
+        elif stats.time_to_target == 0:
+            self.target_label.config(text="reached")
+        else:
+            self.target_label.config(text=f"in {_format_duration(stats.time_to_target)}")
+        if stats.ror_seconds is None:
+            self.ror_label.config(text="Rate of rise: -- (measured while the turbo is stopped)")
+        elif stats.ror is None:
+            self.ror_label.config(text="Rate of rise: measuring...")
+        else:
+            self.ror_label.config(text=f"Rate of rise: {stats.ror:.2e} {units}/s over {_format_duration(stats.ror_seconds)}")
 
-            sstr = '' if status is None else str(status).lower()
-            is_stopped = 'stopped' in sstr or sstr.strip() == 'stopped'
+    def show_link_stats(self, stats):
+        """Show how much of the serial link the polls are using"""
+        self.link_label.config(text=f"Link: {stats['utilization']:.1%} busy "
+                                    f"(planned {stats['planned']:.1%} of {stats['baud']} baud), "
+                                    f"pressure every {stats['pressure_period']:.2g} s")
+        self.show_diagnostics(stats.get('windows', {}))
 
-            # Check turbo speed equals 0
-            try:
-                turbo = get_turbo_speed(self.ser)
-                tnum = self._parse_pressure_value(turbo)
-            except Exception as e:
-                messagebox.showerror("Turbo Read Error", f"Failed to read turbo speed:\n{e}")
-                return
+    def show_diagnostics(self, windows):
+        """Fill the diagnostics table from LinkMetrics.summary(); failing windows are highlighted"""
+        self.diag_tree.tag_configure('failing', foreground='red')
+        fmt = lambda ms: '--' if ms is None else f"{ms:.1f}"
+        for (window, op), m in windows.items():
+            iid = f"{window}.{op}"
+            values = (m['count'], fmt(m['p50_ms']), fmt(m['p95_ms']), fmt(m['max_ms']),
+                      m['timeout'], m['nak'], m['crc'], m['error'],
+                      f"{m['bytes_sent']}/{m['bytes_received']}")
+            tags = ('failing',) if m['timeout'] + m['nak'] + m['crc'] + m['error'] else ()
+            if self.diag_tree.exists(iid):
+                self.diag_tree.item(iid, values=values, tags=tags)
+            else:
+                self.diag_tree.insert('', 'end', iid=iid, text=f"{window} ({op})", values=values, tags=tags)
 
-            is_turbo_zero = (tnum is not None and tnum == 0)
+    def show_poll_error(self, message):
+        self.pressure_label.config(text="Error", foreground="red")
+        self.units_label.config(text=message)
+        self.turbo_label.config(text="Turbo: Error")
+        self.turbo_status_label.config(text="--", foreground="red")
 
-            if is_turbo_zero:
-                try:
-                    if not start_pump(self.ser):
-                        raise Exception("Pump did not acknowledge start command")
-                    messagebox.showinfo("Pump Command", "Start command sent")
-                except Exception as e:
-                    messagebox.showerror("Pump Error", f"Failed to send start command:\n{e}")
-            else:
-                messagebox.showwarning("Cannot Start Pump",
-                                       f"Pump not started because conditions not met:\nstatus='{status}'\nturbo='{turbo}'\nExpected: status='stopped' and turbo=0")
-        except Exception as e:
-            messagebox.showerror("Pump Error", f"Unexpected error:\n{e}")
+    def do_start_pump(self):
+        """Ask the worker to start the pump (it checks status and turbo speed first)"""
+        if not self.connected:
+            messagebox.showwarning("Warning", "Pump not connected")
+            return
+        self.worker.submit('start_pump')
+
+    def on_start_pump_result(self, result):
+        if result['error']:
+            messagebox.showerror(*result['error'])
+        elif result['started']:
+            messagebox.showinfo("Pump Command", "Start command sent")
+        else:
+            messagebox.showwarning("Cannot Start Pump",
+                                   f"Pump not started because conditions not met:\nstatus='{result['status']}'\nturbo='{result['turbo']}'\nExpected: status='stopped' and turbo=0")
 
     def do_stop_pump(self):
-        """Send stop command to the pump"""
-        if self.ser is None:
+        """Ask the worker to send the stop command to the pump"""
+        if not self.connected:
             messagebox.showwarning("Warning", "Pump not connected")
             return
-        try:
-            stop_pump(self.ser)
+        # a commanded stop is not a turbo drop
+        self.alarms.rule('turbo_drop').expect_stop()
+        self.worker.submit('stop_pump')
+
+    def on_stop_pump_result(self, result):
+        if result['error']:
+            messagebox.showerror(*result['error'])
+        else:
             messagebox.showinfo("Pump Command", "Stop command sent")
-        except Exception as e:
-            messagebox.showerror("Pump Error", f"Failed to send stop command:\n{e}")
     
     def close_app(self):
         """Close the application"""
+        self.shutdown()
+        self.root.destroy()
+
+    def shutdown(self, timeout=2.0):
+        """Stop monitoring and close the worker (waiting up to `timeout` s for it)"""
         self.stop_monitoring()
         # Cancel any pending callbacks
         if self.pending_callback:
@@ -421,16 +772,19 @@ class PumpGUI:
                 self.root.after_cancel(self.plot_callback)
             except Exception:
                 pass
-        if self.ser:
-            try:
-                close_comm(self.ser)
-            except Exception as e:
-                print(f"Error closing serial connection: {e}")
-        self.root.destroy()
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
+        if self.profiler.running:
+            self.profiler.stop()
+        if self.worker:
+            # the worker closes the serial port after finishing any queued command
+            self.worker.submit('close')
+            self.worker.join(timeout=timeout)
 
     def save_plot_csv(self):
         """Save the current pressure vs time data to a CSV file."""
-        if not self.times or not self.prices:
+        if not len(self.plot_data):
             messagebox.showwarning("No Data", "No plot data available to save.")
             return
 
@@ -444,96 +798,304 @@ class PumpGUI:
             with open(path, 'w', newline='') as f:
                 writer = csv.writer(f)
                 writer.writerow(['timestamp_iso', 'seconds_since_start', 'pressure', 'units'])
-                t0 = self.times[0]
+                times, values = self.plot_data.window()
+                t0 = times[0]
                 units = self.units_label.cget('text')
-                for t, p in zip(self.times, self.prices):
+                for t, p in zip(times.tolist(), values[0].tolist()):
                     iso = datetime.datetime.fromtimestamp(t).isoformat()
                     seconds = t - t0
                     writer.writerow([iso, f"{seconds:.3f}", p, units])
 
-            messagebox.showinfo("Saved", f"Saved CSV to {path}")
+            messagebox.showinfo("Saved", f"Saved CSV to {path}\n\nFull-resolution logs are written continuously to {self.log_dir}")
         except Exception as e:
             messagebox.showerror("Save Error", f"Failed to save CSV:\n{e}")
 
-    def _parse_pressure_value(self, text):
-        """Attempt to extract a float from the pressure string."""
-        import re
-        if not text:
-            return None
-        m = re.search(r'[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?', str(text))
-        if not m:
-            return None
-        try:
-            return float(m.group(0))
-        except Exception:
-            return None
-
     def update_plot(self):
         """Sample current pressure and update the matplotlib plot."""
         if not HAS_MPL:
             return
+        self.sample_plot()
+        self.redraw_plot()
+
+        # schedule next plot update
+        try:
+            self.plot_callback = self.loop_monitor.after(self.root, self.plot_interval, self.update_plot)
+        except Exception:
+            self.plot_callback = None
+
+    def sample_plot(self):
+        """Append one plot point: the average of the samples since the last one."""
         # aggregate high-resolution samples from the last plot interval
-        now = time.time()
+        now = self.clock()
         cutoff = now - (self.plot_interval / 1000.0)
-        # collect samples in hr arrays newer than cutoff
-        values = [v for (t, v) in zip(self.hr_times, self.hr_pressures) if t >= cutoff]
-        turbo_avg = None
-        if values:
-            avg = sum(values) / len(values)
-            # compute turbo average for the same samples (ignore None)
-            tvals = [v for (t, v) in zip(self.hr_times, self.hr_turbos) if t >= cutoff and v is not None]
-            if tvals:
-                turbo_avg = sum(tvals) / len(tvals)
-            self.times.append(now)
-            self.prices.append(avg)
-            self.turbo_values.append(turbo_avg)
-        else:
+        # binary-search the hr buffer for samples newer than cutoff and average them
+        pressure = self.hr.aggregate('pressure', cutoff)
+        if pressure.count:
+            turbo = self.hr.aggregate('turbo', cutoff)  # NaN (no turbo readings) is kept as missing
+            self.plot_data.append(now, pressure.mean, turbo.mean)
+        elif self.last_pressure_value is not None:
             # fallback to last value if no high-res samples
-            if self.last_pressure_value is not None:
-                self.times.append(now)
-                self.prices.append(self.last_pressure_value)
-                self.turbo_values.append(None)
+            self.plot_data.append(now, self.last_pressure_value, None)
 
-        if len(self.times) > 0:
-            # convert timestamps to matplotlib date numbers for x axis
-            try:
-                xs = mdates.date2num([datetime.datetime.fromtimestamp(t) for t in self.times])
-            except Exception:
-                # fallback to relative seconds if date conversion fails
-                t0 = self.times[0]
-                xs = [t - t0 for t in self.times]
-            ys = list(self.prices)
-            # filter non-positive values for log scale: replace with NaN so matplotlib skips them
-            ys_filtered = [v if (v is not None and v > 0) else float('nan') for v in ys]
-            # only update plot if there is at least one positive sample
-            if not any((v > 0) for v in ys if v is not None):
-                # schedule next plot update before returning so updates continue
-                try:
-                    self.plot_callback = self.root.after(self.plot_interval, self.update_plot)
-                except Exception:
-                    self.plot_callback = None
-                return
-            self.line.set_data(xs, ys_filtered)
-            self.ax.relim()
-            self.ax.autoscale_view()
-            self.ax.set_xlabel('Time')
-            try:
-                # rotate labels for readability
-                for label in self.ax.get_xticklabels():
-                    label.set_rotation(30)
-                    label.set_ha('right')
-            except Exception:
-                pass
-            self.canvas.draw_idle()
+    def redraw_plot(self):
+        """Bring the pressure line up to date for the selected view.
 
-        # schedule next plot update
+        Only buckets added since the last call are converted to axis units and
+        appended. The axes are fully redrawn only when the view or pyramid level
+        changes or the data leaves the current limits; otherwise just the line
+        is blitted over the cached background.
+        """
+        if not HAS_MPL:
+            return
+        if self.render_mode:
+            if self.renderer is not None:
+                self.request_render()
+            return
+        now = self.clock()
+        view = self.view_var.get()
+        span = self.view_spans[view]
+        start = now - span
+        # about one min/max bucket per horizontal pixel
         try:
-            self.plot_callback = self.root.after(self.plot_interval, self.update_plot)
+            max_points = max(100, self.canvas_widget.winfo_width())
         except Exception:
-            self.plot_callback = None
+            max_points = 1000
+        level = self.pyramid.choose_level(start, now, max_points)
+        full = (view, level) != self._line_key
+        if full:
+            self._line_key = (view, level)
+            self._line_n = 0
+            self._line_tail = None  # belonged to the previous view; this one may have no buckets yet
+            since = start
+        elif self._line_tail is not None:
+            # the last bucket drawn may have changed since: replace its two points
+            self._line_n = max(0, self._line_n - 2)
+            since = self._line_tail
+        else:
+            since = start
+        width = self.pyramid.levels[level][0]
+        starts, mins, maxs = self.pyramid.buckets(level, since, now)
+        if len(starts):
+            self._line_tail = float(starts[-1])
+            self._append_line(np.repeat(self._to_axis(starts + width / 2), 2),
+                              np.column_stack((mins, maxs)).ravel())
+        n = self._line_n
+        if not n or not np.any(self._line_y[:n] > 0):
+            if full:
+                # nothing in this view: don't leave the previous view's line up
+                self.line.set_data([], [])
+                self.canvas.draw_idle()
+            return
+        # non-positive values can't be shown on a log scale: matplotlib skips NaN
+        xs = self._line_x[:n]
+        ys = np.where(self._line_y[:n] > 0, self._line_y[:n], np.nan)
+        self.line.set_data(xs, ys)
+        self.line.set_marker('o' if n < 200 else '')
+
+        x_lo, x_hi = self.ax.get_xlim()
+        y_lo, y_hi = self.ax.get_ylim()
+        new_ys = ys[max(0, n - 2 * len(starts)):]
+        new_ys = new_ys[~np.isnan(new_ys)]
+        if full or xs[-1] > x_hi or (len(new_ys) and (new_ys.min() < y_lo or new_ys.max() > y_hi)):
+            self._rescale_plot(start, span, xs, ys)
+        else:
+            self._blit_line()
+
+    def request_render(self):
+        """Send the decimated pressure and turbo series for the selected view to the render process."""
+        now = self.clock()
+        start = now - self.view_spans[self.view_var.get()]
+        width = max(100, self.plot_view.winfo_width())
+        height = max(100, self.plot_view.winfo_height())
+        level = self.pyramid.choose_level(start, now, width)
+        starts, mins, maxs = self.pyramid.buckets(level, start, now)
+        half = self.pyramid.levels[level][0] / 2
+        turbo_times, values = self.plot_data.window(start)
+        self.renderer.submit(width, height, start, now,
+                             np.repeat(starts + half, 2), np.column_stack((mins, maxs)).ravel(),
+                             turbo_times, values[self.plot_data.columns.index('turbo')],
+                             self.units_label.cget('text').strip('-') or None)
+
+    def show_rendered_plot(self):
+        """Show the newest image from the render process, if one has arrived."""
+        result = self.renderer.poll()
+        if result is None:
+            if not self.renderer.alive():
+                print("Plot render process exited; the plot is no longer updated")
+                self.renderer = None
+            return
+        if result.error:
+            print(f"Error rendering plot: {result.error}")
+            return
+        self.plot_photo = tk.PhotoImage(data=result.ppm, format='PPM')
+        self.plot_view.itemconfigure(self.plot_image_item, image=self.plot_photo)
+
+    def _on_plot_resize(self, event):
+        size = (event.width, event.height)
+        if size != self._render_size:
+            self._render_size = size
+            self.redraw_plot()
+
+    def _append_line(self, xs, ys):
+        n = self._line_n
+        if n + len(xs) > len(self._line_x):
+            size = 2 * (n + len(xs))
+            self._line_x = np.resize(self._line_x, size)
+            self._line_y = np.resize(self._line_y, size)
+        self._line_x[n:n + len(xs)] = xs
+        self._line_y[n:n + len(ys)] = ys
+        self._line_n = n + len(xs)
+
+    def _to_axis(self, times):
+        """Matplotlib date numbers (local time) for unix timestamps."""
+        return mdates.date2num([datetime.datetime.fromtimestamp(t) for t in times.tolist()])
+
+    def _rescale_plot(self, start, span, xs, ys):
+        """Set new axis limits (with headroom) and schedule a full redraw."""
+        # x: the view plus 10% headroom on the right so the next redraws can blit
+        x_lo, x_hi = self._to_axis(np.array([start, start + 1.1 * span]))
+        # drop points that scrolled out of view so the arrays stay bounded
+        keep = max(0, int(np.searchsorted(xs, x_lo)) - 2)
+        if keep:
+            n = self._line_n - keep
+            self._line_x[:n] = self._line_x[keep:self._line_n]
+            self._line_y[:n] = self._line_y[keep:self._line_n]
+            self._line_n = n
+            xs, ys = self._line_x[:n], np.where(self._line_y[:n] > 0, self._line_y[:n], np.nan)
+            self.line.set_data(xs, ys)
+        self.ax.set_xlim(max(x_lo, xs[0]), x_hi)
+        # y: whole decades around the visible data
+        self.ax.set_ylim(10 ** np.floor(np.log10(np.nanmin(ys))), 10 ** np.ceil(np.log10(np.nanmax(ys))))
+        self.ax.set_xlabel('Time')
+        try:
+            # rotate labels for readability
+            for label in self.ax.get_xticklabels():
+                label.set_rotation(30)
+                label.set_ha('right')
+        except Exception:
+            pass
+        self._background = None
+        self.canvas.draw_idle()
+
+    def _on_plot_draw(self, event):
+        """After a full draw, cache the axes background and blit the line on top."""
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
+
+    def _blit_line(self):
+        if self._background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
+
+
+class MultiPumpGUI:
+    """Several pumps in one window, one notebook tab (a PumpGUI panel) each.
+
+    Every panel has its own AcquisitionWorker, so the pumps are polled in
+    parallel and a slow one never delays the rest. A single Tk loop drains
+    all panels' events and samples their plot points; only the visible tab's
+    plot is redrawn, so each added pump costs the loop almost nothing.
+    """
+
+    def __init__(self, root, pumps, render_process=False):
+        # pumps: [(name, port, address), ...]
+        self.root = root
+        self.root.title("Cryostation Pump Monitor")
+        self.root.state('zoomed')  # Maximize window on startup
+        self.root.resizable(True, True)
+        self.drain_interval = 100  # milliseconds between draining worker events
+        self.plot_interval = 5000  # milliseconds between plot points
+        self.drain_callback = None
+        self.plot_callback = None
+        self.loop_monitor = LoopMonitor()
+        self.profiler = ProfileCapture(monitor=self.loop_monitor)
+        self.loop_status = LoopStatusBar(root, self.loop_monitor, self.profiler)
+
+        self.notebook = ttk.Notebook(root)
+        self.notebook.pack(fill="both", expand=True)
+        self.panels = []
+        self._tab_texts = []
+        for name, port, address in pumps:
+            frame = ttk.Frame(self.notebook)
+            self.notebook.add(frame, text=name)
+            self._tab_texts.append(name)
+            self.panels.append(PumpGUI(root, port=port, address=address, name=name, parent=frame,
+                                       close_command=self.close_app, render_process=render_process))
+        self.notebook.bind('<<NotebookTabChanged>>', lambda event: self.visible().redraw_plot())
+        self.update_panels()
+        self.update_plots()
+        self.root.protocol("WM_DELETE_WINDOW", self.close_app)
+
+    def visible(self):
+        return self.panels[self.notebook.index('current')]
+
+    def update_panels(self):
+        """Drain every panel's worker events; tabs of pumps with active alarms are marked"""
+        self.drain_callback = None
+        for i, panel in enumerate(self.panels):
+            panel.drain_events()
+            text = f"{panel.name} (!)" if panel.alarms.active() else panel.name
+            if text != self._tab_texts[i]:
+                self._tab_texts[i] = text
+                self.notebook.tab(i, text=text)
+        self.loop_status.tick()
+        self.drain_callback = self.loop_monitor.after(self.root, self.drain_interval, self.update_panels)
+
+    def update_plots(self):
+        """Add a plot point for every monitoring panel and redraw the visible one"""
+        self.plot_callback = None
+        if HAS_MPL:
+            for panel in self.panels:
+                if panel.monitoring:
+                    panel.sample_plot()
+            self.visible().redraw_plot()
+        self.plot_callback = self.loop_monitor.after(self.root, self.plot_interval, self.update_plots)
+
+    def close_app(self):
+        for callback in (self.drain_callback, self.plot_callback):
+            if callback:
+                self.root.after_cancel(callback)
+        if self.profiler.running:
+            self.profiler.stop()
+        # ask every worker to close first so the ports close in parallel
+        for panel in self.panels:
+            panel.shutdown(timeout=0)
+        for panel in self.panels:
+            if panel.worker:
+                panel.worker.join(timeout=2.0)
+        self.root.destroy()
+
+
+def parse_pump(text):
+    """NAME=PORT[@ADDRESS] (address as a byte, e.g. 0x81) -> (name, port, address)"""
+    name, sep, rest = text.partition('=')
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"expected NAME=PORT[@ADDRESS], got {text!r}")
+    port, sep, address = rest.partition('@')
+    try:
+        address = int(address, 0) if sep else ADDRESS
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad address in {text!r}") from None
+    if not 0 <= address <= 0xFF:
+        raise argparse.ArgumentTypeError(f"address in {text!r} must be a byte (0-255)")
+    return name, port or None, address
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python pump_gui.py", description="Cryostation pump monitor")
+    parser.add_argument('--pump', dest='pumps', action='append', type=parse_pump, default=[],
+                        help="monitor a pump as NAME=PORT[@ADDRESS], e.g. --pump A=COM6 --pump B=COM7 "
+                             "(repeat for each; default: one pump, discovered)")
+    parser.add_argument('--render-process', action='store_true',
+                        help="draw the plot in a separate process so redraws never stall the window")
+    args = parser.parse_args()
     root = tk.Tk()
-    app = PumpGUI(root)
+    if args.pumps:
+        app = MultiPumpGUI(root, args.pumps, render_process=args.render_process)
+    else:
+        app = PumpGUI(root, render_process=args.render_process)
     root.mainloop()
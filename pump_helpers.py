@@ -1,22 +1,234 @@
 #%%
 import serial
-import serial.tools.list_ports
-import sys
-import re
-import keyboard
-from datetime import datetime
+import json
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pump_metrics import METRICS
+from pump_trace import TRACE, TX, RX
 
-def open_comm():
-    """Opens an RS-232 connection to pump"""
-    ports = serial.tools.list_ports.comports()
-    for port in ports:
-        print(f"Port: {port.device}, Description: {port.description}, HWID: {port.hwid}")
+STX = b'\x02'
+ETX = b'\x03'
+ACK = b'\x06'
+NAK = b'\x15'
+ADDRESS = 0x80  # RS-232 address byte (0x80 for point-to-point; 0x80 + n for pump n on an RS-485 bus)
+READ = b'0'
+WRITE = b'1'
+BAUD_RATE = 9600
+READ_TIMEOUT = 0.05  # seconds; short per-read port timeout so frame reads return promptly
+COMMAND_TIMEOUT = 0.5  # seconds allowed for a complete reply frame
+DEFAULT_PORT = 'COM6'  # tried first when there is no cached port yet
+PROBE_TIMEOUT = 0.3  # seconds a candidate port gets to answer the units read
+PORT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pump_port.json')
+SERVER_URL = 'socket://127.0.0.1:5760'  # pump_server, tried before the serial ports when discovering
 
-    # Open a serial port
-    ser = serial.Serial('COM6', 9600, timeout=1)
+# Window registry (Agilent TPS-compact manual p. 214).
+# access: 'R', 'W' or 'RW'; dtype: 'L' logic, 'N' numeric, 'A' alphanumeric
+Window = namedtuple('Window', ['number', 'access', 'dtype', 'length', 'description'])
+
+WINDOWS = {
+    'start_stop': Window(0, 'RW', 'L', 1, 'Start/stop (1 = start, 0 = stop)'),
+    'serial_mode': Window(8, 'RW', 'L', 1, 'Remote mode (0 = serial, 1 = front panel)'),
+    'units': Window(163, 'RW', 'N', 6, 'Pressure units (0 = mBar, 1 = Pascal, 2 = Torr)'),
+    'speed_after_stop': Window(167, 'RW', 'L', 1, 'Turbo speed reading after stop'),
+    'pressure': Window(224, 'R', 'A', 10, 'Pressure reading in units of window 163'),
+    'turbo_speed': Window(226, 'R', 'N', 6, 'Turbo speed (rpm)'),
+    'tipseal_life': Window(358, 'RW', 'N', 6, 'Tip seal life (hours)'),
+}
+
+def _xor_checksum(data):
+    """XOR of all bytes in `data`."""
+    result = 0
+    for byte in data:
+        result ^= byte
+    return result
+
+def _crc_chars(body):
+    """CRC of a frame body (everything after STX up to and including ETX) as two ASCII hex chars."""
+    return b'%02X' % _xor_checksum(body)
+
+def _format_data(window, value):
+    """Format a write value as the fixed-width data field for `window`."""
+    match window.dtype:
+        case 'L': text = '1' if int(value) else '0'
+        case 'N': text = f"{int(value):0{window.length}d}"
+        case _: text = str(value).ljust(window.length)
+    if len(text) != window.length:
+        raise ValueError(f"Value {value!r} does not fit window {window.number:03d} ({window.dtype}{window.length})")
+    return text.encode('ascii')
+
+def build_frame(name, value=None, address=ADDRESS):
+    """Build a command frame for window `name`: a read if `value` is None, else a write."""
+    window = WINDOWS[name]
+    if value is None:
+        if 'R' not in window.access:
+            raise ValueError(f"Window {window.number:03d} is not readable")
+        body = bytes([address]) + b'%03d' % window.number + READ + ETX
+    else:
+        if 'W' not in window.access:
+            raise ValueError(f"Window {window.number:03d} is not writable")
+        body = bytes([address]) + b'%03d' % window.number + WRITE + _format_data(window, value) + ETX
+    return STX + body + _crc_chars(body)
+
+def _build_reply(code, address=ADDRESS):
+    body = bytes([address]) + code + ETX
+    return STX + body + _crc_chars(body)
+
+# fixed writes: key -> (window, value)
+WRITE_COMMANDS = {
+    'start': ('start_stop', 1),
+    'stop': ('start_stop', 0),
+    'serial_mode': ('serial_mode', 0),
+    'speed_after_stop': ('speed_after_stop', 1),
+    'tipseal_reset': ('tipseal_life', 0),
+}
+# Precompiled frames for one pump address: {name: read frame}, {key: write frame}, ACK and NAK replies
+Frames = namedtuple('Frames', ['read', 'write', 'ack', 'nak'])
+_frames = {}
+
+def frames_for(address=ADDRESS):
+    """Command and reply frames for the pump at `address`, built once per address
+    so the poll path never re-encodes a command."""
+    frames = _frames.get(address)
+    if frames is None:
+        frames = _frames[address] = Frames(
+            {name: build_frame(name, address=address) for name, w in WINDOWS.items() if 'R' in w.access},
+            {key: build_frame(name, value, address) for key, (name, value) in WRITE_COMMANDS.items()},
+            _build_reply(ACK, address), _build_reply(NAK, address))
+    return frames
+
+READ_FRAMES, WRITE_FRAMES, ACK_FRAME, NAK_FRAME = frames_for(ADDRESS)
+WINDOW_NAMES = {b'%03d' % w.number: name for name, w in WINDOWS.items()}
+
+UNITS_NAMES = {0: "mBar", 1: "Pascal", 2: "Torr"}
+PRESSURE_CHARS = 7  # window 224 holds X.XEsXX in the first 7 characters of its field
+PRESSURE_FORMAT = '.1E'  # formats a decoded pressure back to the pump's X.XEsXX text
+
+# One poll cycle: every window in the snapshot shares a single timestamp.
+# `failed` names the requested windows that did not answer sensibly.
+Snapshot = namedtuple('Snapshot', ['ts', 'units', 'pressure_text', 'pressure', 'turbo_speed', 'tipseal_life', 'failed'])
+SNAPSHOT_WINDOWS = ('units', 'pressure', 'turbo_speed')
+
+def _read_port_cache(path):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def _load_port_cache(path=PORT_CACHE, address=ADDRESS):
+    """Last port/settings the pump at `address` answered on, or {} if unknown.
+
+    The default address's entry is the top level of the file; other
+    addresses (pumps on RS-485) are kept under 'addresses'.
+    """
+    cache = _read_port_cache(path)
+    if address != ADDRESS:
+        cache = cache.get('addresses', {}).get(f"0x{address:02X}", {})
+    return cache if isinstance(cache, dict) else {}
+
+def _save_port_cache(port, baud, path=PORT_CACHE, address=ADDRESS):
+    cache = _read_port_cache(path)
+    if address == ADDRESS:
+        cache.update(port=port, baud=baud)
+    else:
+        cache.setdefault('addresses', {})[f"0x{address:02X}"] = {'port': port, 'baud': baud}
+    try:
+        with open(path, 'w') as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"Could not save port cache {path}: {e}")
+
+def _open_port(port, baud=BAUD_RATE):
+    """Open a serial port, or a pyserial URL such as a pump_server's socket://host:port."""
+    if '://' in port:
+        return serial.serial_for_url(port, baud, timeout=READ_TIMEOUT)
+    return serial.Serial(port, baud, timeout=READ_TIMEOUT)
+
+def probe_port(port, baud=BAUD_RATE, timeout=PROBE_TIMEOUT, address=ADDRESS):
+    """Open `port` and read the units window; returns the open Serial if a pump answered, else None."""
+    try:
+        ser = _open_port(port, baud)
+    except (serial.SerialException, OSError, ValueError):
+        return None
+    try:
+        if read_windows(ser, ('units',), timeout, address=address)['units'] in UNITS_NAMES:
+            return ser
+    except (serial.SerialException, OSError):
+        pass
+    ser.close()
+    return None
+
+def _server_listening(url, timeout):
+    """True if something accepts connections at socket:// `url` within `timeout` s."""
+    host, port = url.split('://', 1)[1].rsplit(':', 1)
+    try:
+        # pyserial waits up to 5 s for a refused connection on some systems; bound it here
+        socket.create_connection((host, int(port)), timeout=timeout).close()
+        return True
+    except OSError:
+        return False
+
+def discover_pump(candidates=None, timeout=PROBE_TIMEOUT, cache_path=PORT_CACHE, server=SERVER_URL, address=ADDRESS):
+    """Find the pump at `address` and return an open Serial to it.
+
+    A pump_server on `server` is used if one is running, since it holds the
+    port. Then the cached port (or DEFAULT_PORT) is tried, so the usual case
+    costs one read. Otherwise every other port is probed at once, each with
+    its own `timeout`, so the worst case is bounded by one probe rather than
+    their sum. The winning port and baud rate are cached for next time.
+    """
+    if server and _server_listening(server, timeout):
+        ser = probe_port(server, timeout=timeout, address=address)
+        if ser is not None:
+            print(f"Pump found through pump_server at {server}")
+            return ser
+    cache = _load_port_cache(cache_path, address)
+    first = cache.get('port', DEFAULT_PORT)
+    baud = cache.get('baud', BAUD_RATE)
+    ser = probe_port(first, baud, timeout, address)
+    if ser is None:
+        if candidates is None:
+            from serial.tools import list_ports  # only needed here; keeps module import fast
+            ports = list_ports.comports()
+            for port in ports:
+                print(f"Port: {port.device}, Description: {port.description}, HWID: {port.hwid}")
+            candidates = [port.device for port in ports]
+        candidates = [port for port in candidates if port != first]
+        if candidates:
+            with ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix="pump-probe") as pool:
+                for found in pool.map(lambda port: probe_port(port, baud, timeout, address), candidates):
+                    if found is None:
+                        continue
+                    if ser is None:
+                        ser = found
+                    else:
+                        found.close()  # first answering port (in listing order) wins
+    if ser is None:
+        raise serial.SerialException(f"No pump answered on {', '.join([first, *(candidates or [])])}")
+    if ser.port != cache.get('port') or baud != cache.get('baud'):
+        _save_port_cache(ser.port, baud, cache_path, address)
+    print(f"Pump found on {ser.port}")
+    return ser
+
+def open_comm(port=None, address=ADDRESS):
+    """Opens an RS-232 connection to pump (on `port`, or wherever discover_pump finds it)
+
+    `port` may also be a pyserial URL; 'socket://127.0.0.1:5760' shares the
+    pump through a running pump_server, and every helper here works on it.
+    `address` is the pump's address byte (see PumpClient for several pumps).
+    """
+    if port is None:
+        ser = discover_pump(address=address)
+    else:
+        ser = _open_port(port)
 
     # Set pump into serial mode
-    set_serial(ser)
+    set_serial(ser, address)
 
     return ser
 
@@ -24,158 +236,449 @@ def close_comm(ser):
     print("Closing serial connection.")
     ser.close()
 
-def get_pressure_reading(ser):
-    # Command: 02 80 32 32 34 (window: 224) 30 (read mode) 03 38 37 (CRC)
-    print("Getting pressure reading...")
-    cmd_str = "028032323430033837"
-    cmd = bytes.fromhex(cmd_str)
-    print(cmd)
+def read_frame(ser, timeout=COMMAND_TIMEOUT):
+    """Read one reply frame (STX ... ETX + 2 CRC chars) from the pump.
+
+    Returns as soon as the frame is complete instead of waiting out the port
+    timeout. Bytes before STX are discarded and a new STX seen before ETX
+    restarts the frame. Returns b'' if no complete frame arrives in `timeout` s.
+    """
+    deadline = time.monotonic() + timeout
+    buf = bytearray()
+    need = 1
+    while time.monotonic() < deadline:
+        chunk = ser.read(max(need, ser.in_waiting))
+        if not chunk:
+            continue
+        buf += chunk
+        start = buf.find(STX)
+        if start < 0:
+            # nothing but garbage so far
+            buf.clear()
+            need = 1
+            continue
+        end = buf.find(ETX, start + 1)
+        if end < 0:
+            if start:
+                del buf[:start]
+            need = 1
+            continue
+        # resync on the last STX before ETX (earlier ones belong to a broken frame)
+        start = buf.rfind(STX, start, end)
+        if start:
+            del buf[:start]
+            end -= start
+        frame_len = end + 3  # ETX + two CRC characters
+        if len(buf) >= frame_len:
+            return bytes(buf[:frame_len])
+        need = frame_len - len(buf)
+    return b''
+
+def _outcome(cmd, frame):
+    """Classify the reply to `cmd` for the link metrics (see pump_metrics.OUTCOMES)."""
+    if not frame:
+        return 'timeout'
+    if _crc_chars(frame[1:-2]) != frame[-2:]:
+        return 'crc'
+    if len(frame) == len(ACK_FRAME):
+        # STX, address, code, ETX, CRC: ACK, NAK or a controller error code
+        code = frame[2:3]
+        return 'ok' if code == ACK else 'nak' if code == NAK else 'error'
+    if frame[2:5] != cmd[2:5]:
+        return 'error'
+    return 'ok'
+
+def _exchange(ser, cmd, timeout=COMMAND_TIMEOUT):
+    """Write one command frame, read its reply frame and record both in TRACE and METRICS."""
+    start = time.monotonic()
+    TRACE.record(TX, cmd, start)
     ser.write(cmd)
-    data = ser.read(100)
-    data = data[6:-6]
-    pressure = data.decode('utf-8')
-    return pressure
+    frame = read_frame(ser, timeout)
+    TRACE.record(RX, frame)
+    window = WINDOW_NAMES.get(cmd[2:5], cmd[2:5].decode('ascii', 'replace'))
+    op = 'write' if cmd[5:6] == WRITE else 'read'
+    METRICS.record(window, op, time.monotonic() - start, _outcome(cmd, frame), len(cmd), len(frame))
+    return frame
+
+def _transact(ser, cmd, timeout=COMMAND_TIMEOUT):
+    """Send one command frame and return the reply frame (b'' on timeout)."""
+    # drop stale bytes from an earlier, timed-out reply
+    ser.reset_input_buffer()
+    return _exchange(ser, cmd, timeout)
+
+class ReplyError(ValueError):
+    """A reply frame that does not carry a trustworthy answer to the command."""
+
+class FrameError(ReplyError):
+    """Missing reply, or wrong STX/ETX/address/length."""
+
+class ChecksumError(ReplyError):
+    """The CRC characters do not match the frame."""
+
+class ControllerError(ReplyError):
+    """The controller answered with NAK or an error code instead of data."""
+
+    def __init__(self, code):
+        super().__init__(f"Controller replied with code 0x{code:02X}")
+        self.code = code
+
+class WindowMismatch(ReplyError):
+    """The reply is for a different window or operation than the one read."""
+
+class DataError(ReplyError):
+    """The data field does not parse as the window's data type."""
+
+_HEX_CRC = [b'%02X' % value for value in range(256)]
+_DIGITS = frozenset(b'0123456789')
+_READ_HEADS = {name: b'%03d' % w.number + READ for name, w in WINDOWS.items()}  # window number + read flag
+_REPLY_LENGTHS = {name: 9 + w.length for name, w in WINDOWS.items()}  # STX addr NNN op data ETX CC
+_STX, _ETX = STX[0], ETX[0]
+
+def _parse_pressure(field):
+    """X.XEsXX at the start of `field` (a memoryview) as a float."""
+    # float() checks the digits; the fixed '.' and 'E' positions rule out nan, inf and plain numbers
+    try:
+        if field[1] == 0x2E and field[3] == 0x45:
+            return float(field[:PRESSURE_CHARS])
+    except (IndexError, ValueError):
+        pass
+    raise DataError(f"Malformed pressure {bytes(field)!r}")
+
+def decode_reply(name, frame, address=ADDRESS):
+    """Validate a read reply for window `name` and return its value.
+
+    Works on a memoryview of `frame`, so nothing is copied before the value
+    itself is parsed. STX, address, length, ETX, CRC, window number and the
+    read flag are all checked first; any mismatch raises the matching
+    ReplyError subclass rather than yielding a value. Values are int for
+    L/N windows, float for pressure and str for other A windows.
+    """
+    view = memoryview(frame)
+    n = len(view)
+    if n < len(ACK_FRAME) or view[0] != _STX or view[n - 3] != _ETX:
+        raise FrameError(f"Incomplete or unframed reply {bytes(view)!r}")
+    if view[1] != address:
+        raise FrameError(f"Reply from address 0x{view[1]:02X}, expected 0x{address:02X}")
+    if view[n - 2:] != _HEX_CRC[_xor_checksum(view[1:n - 2])]:
+        raise ChecksumError(f"Bad CRC in reply {bytes(view)!r}")
+    if n == len(ACK_FRAME):
+        raise ControllerError(view[2])
+    if view[2:6] != _READ_HEADS[name]:
+        raise WindowMismatch(f"Reply {bytes(view[2:6])!r} does not answer a read of window {name}")
+    if n != _REPLY_LENGTHS[name]:
+        raise FrameError(f"Reply for window {name} is {n} bytes, expected {_REPLY_LENGTHS[name]}")
+    field = view[6:n - 3]
+    match WINDOWS[name].dtype:
+        case 'L':
+            if field[0] not in b'01':
+                raise DataError(f"Malformed logic value {bytes(field)!r}")
+            return field[0] - 0x30
+        case 'N':
+            if not _DIGITS.issuperset(field):
+                raise DataError(f"Malformed number {bytes(field)!r}")
+            return int(field)
+        case _:
+            if name == 'pressure':
+                return _parse_pressure(field)
+            try:
+                return bytes(field).decode('ascii').strip()
+            except UnicodeDecodeError:
+                raise DataError(f"Malformed text {bytes(field)!r}") from None
+
+DECODE_CACHE_SIZE = 4096
+_decoded = {}  # (name, reply frame, expected address) -> value; steady readings repeat the same frames
+
+def _decode_value(name, frame, address=ADDRESS):
+    """decode_reply(), or None if the reply is missing or fails validation.
 
-def get_pressure_units(ser):
-    # Command: 02 80 31 36 33 (window: 163) 30 (read mode) 03 38 35 (CRC)
+    Frames that already passed validation are answered from a small cache,
+    so a steady reading is not re-checked and re-parsed on every poll.
+    """
+    # the expected address is part of the key: a frame valid for one pump must not be accepted for another
+    key = (name, frame, address)
+    value = _decoded.get(key)
+    if value is not None:
+        return value
+    try:
+        value = decode_reply(name, frame, address)
+    except ReplyError:
+        return None
+    if len(_decoded) >= DECODE_CACHE_SIZE:
+        _decoded.clear()
+    _decoded[key] = value
+    return value
+
+def read_windows(ser, names, timeout=COMMAND_TIMEOUT, stop_on_timeout=False, address=ADDRESS):
+    """Read windows `names` back-to-back from precompiled frames.
+
+    Returns {name: value} with values decoded by decode_reply() (int for
+    L/N, float for pressure, str for other A windows), or None for a window
+    whose reply was missing or failed validation. With
+    `stop_on_timeout`, the windows after one that got no reply at all are
+    skipped (None), so a dead link costs one timeout rather than one per window.
+    """
+    read_frames = frames_for(address).read
+    ser.reset_input_buffer()
+    values = dict.fromkeys(names)
+    for name in names:
+        frame = _exchange(ser, read_frames[name], timeout)
+        values[name] = _decode_value(name, frame, address)
+        if stop_on_timeout and not frame:
+            break
+    return values
+
+def poll_snapshot(ser, names=SNAPSHOT_WINDOWS, timeout=COMMAND_TIMEOUT, stop_on_timeout=False, address=ADDRESS):
+    """Read `names` in one batch and return them as a Snapshot with one timestamp.
+
+    Windows not in `names` (or that failed) are None in the snapshot; failed
+    windows are also listed in `snapshot.failed`.
+    """
+    ts = time.time()
+    return make_snapshot(ts, names, read_windows(ser, names, timeout, stop_on_timeout, address))
+
+def make_snapshot(ts, names, values):
+    """Build a Snapshot from read_windows() output for windows `names` read at `ts`."""
+    pressure = values.get('pressure')
+    pressure_text = None if pressure is None else format(pressure, PRESSURE_FORMAT)
+    units = UNITS_NAMES.get(values.get('units'))
+    typed = {'units': units, 'pressure': pressure}
+    failed = tuple(name for name in names if typed.get(name, values[name]) is None)
+    return Snapshot(ts, units, pressure_text, pressure,
+                    values.get('turbo_speed'), values.get('tipseal_life'), failed)
+
+# The single-value helpers return None (or a failure string) when the reply
+# fails decode_reply(), never a value made up from a broken frame.
+
+def get_pressure_reading(ser, address=ADDRESS):
+    print("Getting pressure reading...")
+    pressure = _decode_value('pressure', _transact(ser, frames_for(address).read['pressure']), address)
+    return None if pressure is None else format(pressure, PRESSURE_FORMAT)
+
+def get_pressure_units(ser, address=ADDRESS):
     print("Getting pressure units...")
-    cmd_str = "02 80 31 36 33 30 03 38 37"
-    ser.write(bytes.fromhex(cmd_str))
-    data = ser.read(100)
-    data = data[-4:-3].decode('utf-8')
-    match data:
-        case '0': return "mBar"
-        case '1': return "Pascal"
-        case '2': return "Torr"
-        case _: return "Get units failed."
-
-def get_turbo_speed(ser):
-    # Command: 02 80 32 32 36 30 03 38 35
+    units = _decode_value('units', _transact(ser, frames_for(address).read['units']), address)
+    return UNITS_NAMES.get(units, "Get units failed.")
+
+def get_turbo_speed(ser, address=ADDRESS):
     print("Getting turbo speed...")
-    cmd_str = "028032323630033835"
-    cmd = bytes.fromhex(cmd_str)
-    print(cmd)
-    ser.write(cmd)
-    data = ser.read(100)
-    print(data)
-    data = data[6:-3]
-    speed = data.decode('utf-8')
-    speed = speed.lstrip('0') or '0'  # Remove leading zeros
-    return speed
-
-def get_tipseal_life(ser):
-    # Command: 02 80 33 35 38 30 03 38 43 (CRC = 0x8D)
+    speed = _decode_value('turbo_speed', _transact(ser, frames_for(address).read['turbo_speed']), address)
+    return None if speed is None else str(speed)
+
+def get_tipseal_life(ser, address=ADDRESS):
     print("Getting tip seal life...")
-    cmd_str = "028033353830033844"
-    cmd = bytes.fromhex(cmd_str)
-    print(cmd)
-    ser.write(cmd)
-    data = ser.read(100)
-    print(data)
-    data = data[6:-3]
-    life = data.decode('utf-8')
-    life = life.lstrip('0') or '0'  # Remove leading zeros
-    return life
-
-def reset_tipseal_life(ser):
-    # Command: 02 80 33 35 38 31 30 30 30 30 30 30 03 38 44 (CRC = 0x8C)
+    life = _decode_value('tipseal_life', _transact(ser, frames_for(address).read['tipseal_life']), address)
+    return None if life is None else str(life)
+
+def reset_tipseal_life(ser, address=ADDRESS):
     print("Resetting tip seal life...")
-    cmd_str = "028033353831303030303030033844"
-    cmd = bytes.fromhex(cmd_str)
-    print(cmd)
-    ser.write(cmd)
-    data = ser.read(100)
+    cmd = frames_for(address).write['tipseal_reset']
+    data = _transact(ser, cmd)
     # Check if the response indicates success
-    if data == b'\x02\x80\x15\x03\x38\x35':
+    if data == frames_for(address).nak:
         success = False
     else:
         success = True
     return success
 
-def start_pump(ser):
-    # Command: 02 80 30 30 30 31 31 03 42 33
+def start_pump(ser, address=ADDRESS):
     print("Starting pump...")
-    cmd_str = "02803030303131034233"
-    cmd = bytes.fromhex(cmd_str)
-    print(cmd)
-    ser.write(cmd)
-    data = ser.read(100)
+    cmd = frames_for(address).write['start']
+    data = _transact(ser, cmd)
     # Check if the response indicates success
-    if data == b'\x02\x80\x06\x03\x38\x35':
+    if data == frames_for(address).ack:
         success = True
     else:
         success = False
     return success
 
-def stop_pump(ser):
-    # Command: 02 80 30 30 30 31 30 03 42 32
+def stop_pump(ser, address=ADDRESS):
     print("Stopping pump...")
-    cmd_str = "02803030303130034232"
-    cmd = bytes.fromhex(cmd_str)
-    print(cmd)
-    ser.write(cmd)
-    data = ser.read(100)
-    print(data)
+    cmd = frames_for(address).write['stop']
+    data = _transact(ser, cmd)
     # Check if the response indicates success
-    if data == b'\x02\x80\x06\x03\x38\x35':
+    if data == frames_for(address).ack:
         success = True
     else:
         success = False
 
     # Turn on turbo speed reading after pump stopped
-    # Command: 02 80 31 36 37 31 31 03 
-    cmd_str = "02803136373131034233"
-    cmd = bytes.fromhex(cmd_str)
-    print(cmd)
-    ser.write(cmd)
-    data = ser.read(100)
-    print(data)
+    cmd = frames_for(address).write['speed_after_stop']
+    data = _transact(ser, cmd)
     return success
 
-def set_serial(ser):
-    # Command: 02 80 30 30 38 31 30 03 42 41
+def set_serial(ser, address=ADDRESS):
     print("Setting serial mode...")
-    cmd_str = "02803030383130034241"
-    cmd = bytes.fromhex(cmd_str)
-    print(cmd)
-    ser.write(cmd)
-    data = ser.read(100)
-    print(data)
+    cmd = frames_for(address).write['serial_mode']
+    data = _transact(ser, cmd)
     # Check if the response indicates success
-    if data == b'\x02\x80\x06\x03\x38\x35':
+    if data == frames_for(address).ack:
         success = True
     else:
         success = False
     return success
 
-def get_pump_status(ser):
-    # Command: 02 80 30 30 30 30 03 38 33
+def get_pump_status(ser, address=ADDRESS):
     print("Getting pump status...")
-    cmd_str = "02803030303030033833"
-    cmd = bytes.fromhex(cmd_str)
-    print(cmd)
-    ser.write(cmd)
-    data = ser.read(100)
-    # Check if the response indicates success
-    if data[-4:-3] == b'1':
-        status = "Running"
-    elif data[-4:-3] == b'0':
-        status = "Stopped"
-    else:
-        status = "Unknown"
-    return status
+    match _decode_value('start_stop', _transact(ser, frames_for(address).read['start_stop']), address):
+        case 1: return "Running"
+        case 0: return "Stopped"
+        case _: return "Unknown"
+
+class _SharedPort:
+    """An open port and the clients using it; `lock` serializes their transactions.
+
+    It is registered before the port is opened, so clients arriving
+    meanwhile wait for `ready` instead of opening a second connection; `ser`
+    is still None after `ready` if the open failed.
+    """
+
+    def __init__(self, ser=None):
+        self.ser = ser
+        self.users = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        if ser is not None:
+            self.ready.set()
+
+_shared_ports = {}  # port name -> _SharedPort
+_shared_lock = threading.Lock()
+
+class PumpClient:
+    """One pump: its port and address byte, and the open connection to it.
+
+    The methods mirror the module functions that talk to the pump
+    (read_windows, poll_snapshot, the get_* helpers, start_pump, stop_pump,
+    set_serial and reset_tipseal_life) without the `ser` and `address`
+    arguments. Several clients may name the same port with different
+    addresses (pumps on one RS-485 bus): they share one open Serial and a
+    per-port lock keeps their transactions apart, while clients on different
+    ports never wait for each other.
+    """
+
+    def __init__(self, port=None, address=ADDRESS):
+        self.port = port  # None = auto-discover (a pump_server, the cached port, then every port)
+        self.address = address
+        self.ser = None
+        self._shared = None
+
+    def __repr__(self):
+        return f"PumpClient({self.port!r}, address=0x{self.address:02X})"
+
+    @property
+    def is_open(self):
+        return self.ser is not None
+
+    def open(self):
+        """Open (or join) the port and put the pump in serial mode; returns self."""
+        if self.ser is not None:
+            return self
+        port = self.port
+        if port is None:
+            # discovery has to open the port to find it; then share it like a named one
+            ser = open_comm(None, self.address)
+            port = ser.port
+            with _shared_lock:
+                if port not in _shared_ports:
+                    shared = _shared_ports[port] = _SharedPort(ser)
+                    shared.users = 1
+                    self._shared, self.ser = shared, ser
+                    return self
+            close_comm(ser)  # another client has it open already; join that one
+        while True:
+            with _shared_lock:
+                shared = _shared_ports.get(port)
+                opener = shared is None
+                if opener:
+                    shared = _shared_ports[port] = _SharedPort()
+                shared.users += 1
+            if opener:
+                # opened outside the registry lock so a slow port never holds up the others
+                try:
+                    shared.ser = open_comm(port, self.address)
+                except Exception:
+                    with _shared_lock:
+                        if _shared_ports.get(port) is shared:
+                            del _shared_ports[port]
+                    raise
+                finally:
+                    shared.ready.set()
+                break
+            shared.ready.wait()
+            if shared.ser is not None:
+                break
+            # the client opening it failed; drop our claim and try ourselves
+            with _shared_lock:
+                shared.users -= 1
+        self._shared = shared
+        self.ser = shared.ser
+        if not opener:
+            try:
+                with shared.lock:
+                    set_serial(shared.ser, self.address)
+            except Exception:
+                self.close()
+                raise
+        return self
+
+    def close(self):
+        """Leave the port; it is closed when its last client leaves."""
+        shared, self._shared, self.ser = self._shared, None, None
+        if shared is None:
+            return
+        with _shared_lock:
+            shared.users -= 1
+            if shared.users:
+                return
+            for port, registered in list(_shared_ports.items()):
+                if registered is shared:
+                    del _shared_ports[port]
+        close_comm(shared.ser)
+
+    def _call(self, function, *args):
+        shared = self._shared
+        if shared is None:
+            raise serial.SerialException(f"{self!r} is not open")
+        with shared.lock:
+            return function(shared.ser, *args, address=self.address)
+
+    def read_windows(self, names, timeout=COMMAND_TIMEOUT, stop_on_timeout=False):
+        return self._call(read_windows, names, timeout, stop_on_timeout)
+
+    def poll_snapshot(self, names=SNAPSHOT_WINDOWS, timeout=COMMAND_TIMEOUT, stop_on_timeout=False):
+        return self._call(poll_snapshot, names, timeout, stop_on_timeout)
+
+    def start_pump(self):
+        return self._call(start_pump)
+
+    def stop_pump(self):
+        return self._call(stop_pump)
+
+    def set_serial(self):
+        return self._call(set_serial)
+
+    def reset_tipseal_life(self):
+        return self._call(reset_tipseal_life)
+
+    def get_pressure_reading(self):
+        return self._call(get_pressure_reading)
+
+    def get_pressure_units(self):
+        return self._call(get_pressure_units)
+
+    def get_turbo_speed(self):
+        return self._call(get_turbo_speed)
+
+    def get_tipseal_life(self):
+        return self._call(get_tipseal_life)
+
+    def get_pump_status(self):
+        return self._call(get_pump_status)
 
 def calculate_crc(hex_str):
     # Convert hex string to bytes (handles 2-char chunks automatically)
     data = bytes.fromhex(hex_str)
-    
-    # Initialize result with 0 (XORing with 0 is a no-op)
-    result = 0
-    for byte in data:
-        result ^= byte
-        
     # Return result as a hex string (e.g., '0x1a')
-    return hex(result)
+    return hex(_xor_checksum(data))
 
 
 # %% Test main
@@ -0,0 +1,129 @@
+# %%
+import csv
+import datetime
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pump_logs')
+LOG_PREFIX = 'pump_log_'
+HEADER = ['timestamp_iso', 'unix_time', 'pressure', 'units', 'turbo_rpm', 'tipseal_hr']
+
+
+class StreamLogger:
+    """Always-on CSV log of every sample at full resolution.
+
+    One row per Snapshot; windows not read in that cycle are left empty. Files
+    are named pump_log_YYYY-MM-DD_NNN.csv and rotate at midnight or when they
+    reach `max_bytes`. Rows go through a buffered writer that is flushed every
+    `flush_interval` seconds, and closed segments are gzipped by a background
+    thread so logging never waits on compression.
+    """
+
+    def __init__(self, directory=DEFAULT_LOG_DIR, max_bytes=50 * 1024 * 1024, flush_interval=5.0, compress=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.path = None  # file currently being written
+        self._file = None
+        self._writer = None
+        self._day = None
+        self._units = None  # last known units, repeated on every row
+        self._last_flush = time.monotonic()
+        self._to_compress = queue.Queue()
+        self._compressor = None
+        os.makedirs(directory, exist_ok=True)
+        if compress:
+            self._compressor = threading.Thread(target=self._compress_loop, name="pump-log-compress", daemon=True)
+            self._compressor.start()
+            # segments left uncompressed by an earlier run (today's last one may be reopened)
+            today = self._segments(datetime.date.today().isoformat())
+            for name in sorted(os.listdir(directory)):
+                if name.startswith(LOG_PREFIX) and name.endswith('.csv') and name not in today[-1:]:
+                    self._to_compress.put(os.path.join(directory, name))
+
+    def write(self, snapshot):
+        """Append one Snapshot as a CSV row, rotating the file if needed."""
+        if snapshot.units is not None:
+            self._units = snapshot.units
+        stamp = datetime.datetime.fromtimestamp(snapshot.ts)
+        day = stamp.date().isoformat()
+        if day != self._day or (self._file is not None and self._file.tell() >= self.max_bytes):
+            self._rotate(day)
+        self._writer.writerow([
+            stamp.isoformat(timespec='milliseconds'),
+            f"{snapshot.ts:.3f}",
+            '' if snapshot.pressure is None else repr(snapshot.pressure),
+            self._units or '',
+            '' if snapshot.turbo_speed is None else snapshot.turbo_speed,
+            '' if snapshot.tipseal_life is None else snapshot.tipseal_life,
+        ])
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Close the current file and wait for pending compression to finish."""
+        self._close_file(compress=False)
+        if self._compressor is not None:
+            self._to_compress.put(None)
+            self._compressor.join(timeout=30.0)
+            self._compressor = None
+
+    def _segments(self, day):
+        """Uncompressed and compressed segment names for `day`, in order."""
+        prefix = f"{LOG_PREFIX}{day}_"
+        return sorted(n for n in os.listdir(self.directory) if n.startswith(prefix))
+
+    def _rotate(self, day):
+        self._close_file(compress=True)
+        existing = self._segments(day)
+        seq = 0
+        if existing:
+            last = existing[-1]
+            seq = int(last[len(LOG_PREFIX) + len(day) + 1:].split('.')[0])
+            # continue today's last file after a restart unless it is finished
+            if not last.endswith('.csv'):
+                seq += 1
+            elif os.path.getsize(os.path.join(self.directory, last)) >= self.max_bytes:
+                seq += 1
+                last_path = os.path.join(self.directory, last)
+                # (the file just closed above is already queued)
+                if self.compress and last_path != self.path:
+                    self._to_compress.put(last_path)
+        self.path = os.path.join(self.directory, f"{LOG_PREFIX}{day}_{seq:03d}.csv")
+        is_new = not os.path.exists(self.path)
+        self._file = open(self.path, 'a', newline='', buffering=64 * 1024)
+        self._writer = csv.writer(self._file)
+        if is_new:
+            self._writer.writerow(HEADER)
+        self._day = day
+
+    def _close_file(self, compress):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self._writer = None
+        if compress and self.compress:
+            self._to_compress.put(self.path)
+
+    def _compress_loop(self):
+        while True:
+            path = self._to_compress.get()
+            if path is None:
+                return
+            try:
+                with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(path)
+            except Exception as e:
+                print(f"Error compressing log {path}: {e}")
@@ -0,0 +1,131 @@
+# %%
+import os
+import threading
+from collections import deque
+
+DEFAULT_METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pump_metrics.prom')
+# latency histogram upper bounds in seconds (Prometheus "le" buckets; +Inf is implicit)
+LATENCY_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+# transaction outcomes; everything but 'ok' is a failure
+OUTCOMES = ('ok', 'timeout', 'nak', 'crc', 'error')
+
+
+class WindowStats:
+    """Counters and latency distribution for one (window, op) pair."""
+
+    def __init__(self, recent=256):
+        self.count = 0
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.buckets = [0] * len(LATENCY_BUCKETS)  # non-cumulative counts per bucket
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.recent = deque(maxlen=recent)  # latest latencies, for percentiles
+
+    def add(self, seconds, outcome, sent, received):
+        self.count += 1
+        self.outcomes[outcome] += 1
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.latency_sum += seconds
+        self.latency_max = max(self.latency_max, seconds)
+        self.recent.append(seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, q):
+        """q-th percentile (0-100) of the recent latencies in seconds, or None."""
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class LinkMetrics:
+    """Per-window statistics of every serial transaction.
+
+    pump_helpers records each command/reply exchange here with its latency,
+    outcome (see OUTCOMES) and byte counts. Safe to read from another thread
+    while the acquisition worker records.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # (window, op) -> WindowStats
+
+    def record(self, window, op, seconds, outcome, sent, received):
+        with self._lock:
+            stats = self._stats.get((window, op))
+            if stats is None:
+                stats = self._stats[(window, op)] = WindowStats()
+            stats.add(seconds, outcome, sent, received)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def summary(self):
+        """{(window, op): {...}} with counts, failures and p50/p95/max latency in ms."""
+        with self._lock:
+            result = {}
+            for key, s in sorted(self._stats.items()):
+                p50, p95 = s.percentile(50), s.percentile(95)
+                result[key] = {
+                    'count': s.count,
+                    **{name: n for name, n in s.outcomes.items() if name != 'ok'},
+                    'p50_ms': None if p50 is None else p50 * 1000,
+                    'p95_ms': None if p95 is None else p95 * 1000,
+                    'max_ms': s.latency_max * 1000,
+                    'bytes_sent': s.bytes_sent,
+                    'bytes_received': s.bytes_received,
+                }
+            return result
+
+    def prometheus_text(self, prefix='pump_serial'):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self._stats.items())
+            lines = [
+                f"# HELP {prefix}_transactions_total Serial transactions by window, operation and outcome.",
+                f"# TYPE {prefix}_transactions_total counter",
+            ]
+            for (window, op), s in items:
+                for outcome, n in s.outcomes.items():
+                    lines.append(f'{prefix}_transactions_total{{window="{window}",op="{op}",outcome="{outcome}"}} {n}')
+            lines += [
+                f"# HELP {prefix}_latency_seconds Command-to-reply latency.",
+                f"# TYPE {prefix}_latency_seconds histogram",
+            ]
+            for (window, op), s in items:
+                labels = f'window="{window}",op="{op}"'
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS, s.buckets):
+                    cumulative += n
+                    lines.append(f'{prefix}_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_latency_seconds_bucket{{{labels},le="+Inf"}} {s.count}')
+                lines.append(f'{prefix}_latency_seconds_sum{{{labels}}} {s.latency_sum:.6f}')
+                lines.append(f'{prefix}_latency_seconds_count{{{labels}}} {s.count}')
+            for direction in ('sent', 'received'):
+                lines += [
+                    f"# HELP {prefix}_bytes_{direction}_total Bytes {direction} on the serial link.",
+                    f"# TYPE {prefix}_bytes_{direction}_total counter",
+                ]
+                for (window, op), s in items:
+                    value = s.bytes_sent if direction == 'sent' else s.bytes_received
+                    lines.append(f'{prefix}_bytes_{direction}_total{{window="{window}",op="{op}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=DEFAULT_METRICS_PATH):
+        """Write prometheus_text() to `path` atomically (for node exporter's textfile collector)."""
+        # one temporary file per thread: each pump's worker rewrites the file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+
+# Default sink for pump_helpers' transactions.
+METRICS = LinkMetrics()
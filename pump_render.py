@@ -0,0 +1,157 @@
+# %%
+"""Draw the pressure/turbo plot in a separate process.
+
+With PumpGUI.render_process set, the Tk thread only decimates the series
+(DecimationPyramid buckets and plot_data's turbo column) and submits them as
+a RenderRequest. A worker process draws them with matplotlib's Agg backend
+and sends back a binary PPM image, which the GUI shows as a Tk PhotoImage.
+A heavy redraw then never holds up event draining or button clicks.
+"""
+import datetime
+import multiprocessing
+import queue
+import time
+from collections import namedtuple
+import numpy as np
+
+# times are unix seconds; pressures come in min/max pairs per bucket; turbos are NaN where unknown
+RenderRequest = namedtuple('RenderRequest', ['seq', 'width', 'height', 'start', 'end', 'times', 'pressures',
+                                             'turbo_times', 'turbos', 'units'])
+# ppm: binary P6 image of width x height, or None with `error` set; seconds: time spent rendering
+RenderResult = namedtuple('RenderResult', ['seq', 'width', 'height', 'ppm', 'seconds', 'error'])
+TURBO_MAX = 90000  # rpm; top of the turbo axis
+
+
+class PlotRenderer:
+    """Draws RenderRequests with matplotlib's Agg backend (runs in the render process)."""
+
+    def __init__(self, dpi=100):
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        import matplotlib.dates as mdates
+        self.mdates = mdates
+        self.dpi = dpi
+        self.fig = Figure(dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.turbo_ax = self.ax.twinx()
+        self.line, = self.ax.plot([], [], '-', color='tab:blue', markersize=4, label='Pressure')
+        self.turbo_line, = self.turbo_ax.plot([], [], '-', color='tab:orange', linewidth=1, alpha=0.7, label='Turbo')
+        self.ax.set_title('Pressure vs Time')
+        self.ax.set_xlabel('Time')
+        self.ax.set_yscale('log')
+        self.ax.set_ylim(5e-7, 1e3)
+        self.ax.grid(True)
+        self.ax.xaxis_date()
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+        self.ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+        self.turbo_ax.set_ylim(0, TURBO_MAX)
+        self.turbo_ax.set_ylabel('Turbo (rpm)')
+        self.ax.legend(handles=[self.line, self.turbo_line], loc='upper right', fontsize='small')
+        self._epoch = mdates.date2num(datetime.datetime(1970, 1, 1))
+
+    def _to_axis(self, times):
+        """Matplotlib date numbers (local time, as PumpGUI._to_axis) for unix timestamps."""
+        times = np.asarray(times, dtype=float)
+        if not len(times):
+            return times
+        offsets = [datetime.datetime.fromtimestamp(t).astimezone().utcoffset().total_seconds()
+                   for t in (times[0], times[-1])]
+        if offsets[0] != offsets[1]:
+            # a daylight-saving change inside the view: convert one by one
+            return self.mdates.date2num([datetime.datetime.fromtimestamp(t) for t in times.tolist()])
+        return self._epoch + (times + offsets[0]) / 86400.0
+
+    def render(self, request):
+        """The plot for `request` as binary PPM bytes."""
+        self.fig.set_size_inches(request.width / self.dpi, request.height / self.dpi)
+        xs = self._to_axis(request.times)
+        # non-positive values can't be shown on a log scale: matplotlib skips NaN
+        ys = np.where(request.pressures > 0, request.pressures, np.nan)
+        self.line.set_data(xs, ys)
+        self.line.set_marker('o' if len(xs) < 200 else '')
+        self.turbo_line.set_data(self._to_axis(request.turbo_times), request.turbos)
+        self.ax.set_xlim(*self._to_axis(np.array([request.start, request.end])))
+        if np.any(ys > 0):
+            # whole decades around the visible data
+            self.ax.set_ylim(10 ** np.floor(np.log10(np.nanmin(ys))), 10 ** np.ceil(np.log10(np.nanmax(ys))))
+        self.ax.set_ylabel(f"Pressure ({request.units})" if request.units else 'Pressure')
+        for label in self.ax.get_xticklabels():
+            label.set_rotation(30)
+            label.set_ha('right')
+        self.canvas.draw()
+        rgba = np.asarray(self.canvas.buffer_rgba())
+        height, width = rgba.shape[:2]
+        return b'P6 %d %d 255\n' % (width, height) + rgba[:, :, :3].tobytes()
+
+
+def _render_loop(requests, results):
+    """Render process: draw the newest request, skipping any that queued up meanwhile."""
+    renderer = PlotRenderer()
+    while True:
+        request = requests.get()
+        while request is not None:
+            try:
+                request = requests.get_nowait()
+            except queue.Empty:
+                break
+        if request is None:
+            return
+        start = time.perf_counter()
+        try:
+            ppm, error = renderer.render(request), None
+        except Exception as e:
+            ppm, error = None, str(e)
+        results.put(RenderResult(request.seq, request.width, request.height, ppm,
+                                 time.perf_counter() - start, error))
+
+
+class RenderWorker:
+    """The render process and its queues.
+
+    submit() never blocks the caller, and poll() returns the newest finished
+    image without waiting. The process is spawned rather than forked so it
+    does not inherit the Tk process's display connection.
+    """
+
+    def __init__(self):
+        context = multiprocessing.get_context('spawn')
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(target=_render_loop, args=(self.requests, self.results),
+                                       name="pump-render", daemon=True)
+        self.process.start()
+        self._seq = 0
+        self.last_seconds = None  # render time of the newest image
+
+    def submit(self, width, height, start, end, times, pressures, turbo_times, turbos, units=None):
+        """Queue a plot for rendering; returns its sequence number."""
+        self._seq += 1
+        self.requests.put(RenderRequest(self._seq, width, height, start, end, times, pressures,
+                                        turbo_times, turbos, units))
+        return self._seq
+
+    def poll(self):
+        """The newest RenderResult that arrived since the last call, or None."""
+        newest = None
+        while True:
+            try:
+                newest = self.results.get_nowait()
+            except queue.Empty:
+                break
+        if newest is not None:
+            self.last_seconds = newest.seconds
+        return newest
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def close(self, timeout=1.0):
+        try:
+            self.requests.put(None)
+            self.process.join(timeout)
+        finally:
+            if self.process.is_alive():
+                self.process.terminate()
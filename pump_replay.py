@@ -0,0 +1,183 @@
+# %%
+"""Replay a dumped wire trace (pump_trace) through the monitor GUI.
+
+    python -m pump_replay pump_traces/pump_trace_20260301_120000_error.bin --speed 600
+
+The recorded replies are decoded into the same Snapshots the worker would
+have published and fed to PumpGUI faster than real time, so field incidents
+can be reproduced and a day of data profiled in seconds. --speed 0 replays as
+fast as the GUI can drain events; --summary prints what the trace holds.
+"""
+import argparse
+import queue
+import threading
+import time
+from pump_helpers import READ, WINDOW_NAMES, Snapshot, _decode_value, make_snapshot
+from pump_trace import TX, load_trace
+
+GROUP_GAP = 0.05  # seconds; reads closer together than this came from one poll batch
+MAX_QUEUED = 500  # events queued ahead of the GUI at --speed 0
+
+
+def snapshots_from_trace(wall, mono, records, gap=GROUP_GAP, only_address=None):
+    """Rebuild the poll snapshots in a trace from its read commands and replies.
+
+    Back-to-back reads form one batch; a batch ends when a window repeats or
+    the link is idle for more than `gap` seconds. Writes are skipped, and so
+    are reads for pumps other than `only_address` if it is given.
+    """
+    snapshots = []
+    names, values = [], {}
+    batch_start = last_reply = None
+    pending = None  # window of a read still waiting for its reply record
+    address = None  # address byte of that read
+
+    def flush():
+        if names:
+            snapshots.append(make_snapshot(wall + (batch_start - mono), tuple(names), dict(values)))
+        names.clear()
+        values.clear()
+
+    for ts, direction, data in records:
+        if direction == TX:
+            pending = None
+            name = WINDOW_NAMES.get(data[2:5]) if data[5:6] == READ else None
+            if name is None or (only_address is not None and data[1] != only_address):
+                continue
+            if names and (name in values or ts - last_reply > gap):
+                flush()
+            if not names:
+                batch_start = ts
+            pending, address = name, data[1]
+        elif pending is not None:
+            names.append(pending)
+            values[pending] = _decode_value(pending, data, address)
+            last_reply = ts
+            pending = None
+    flush()
+    return snapshots
+
+
+class TraceReplay(threading.Thread):
+    """Plays recorded snapshots to PumpGUI in place of AcquisitionWorker.
+
+    Accepts the same commands and publishes the same events. A snapshot is
+    sent as a 'sample' once clock() reaches its timestamp; clock() runs
+    `speed` times faster than real time from the first snapshot while
+    monitoring and stands still otherwise. PumpGUI uses it as its clock
+    during a replay so the plot follows the recorded times.
+    """
+
+    def __init__(self, path, speed=60.0, address=None):
+        super().__init__(name="pump-replay", daemon=True)
+        wall, mono, records = load_trace(path)
+        self.path = path
+        # address: replay only this pump from a multi-pump trace
+        self.snapshots = snapshots_from_trace(wall, mono, records, only_address=address)
+        self.speed = speed  # 0 or None: as fast as the events are drained
+        self.commands = queue.Queue()
+        self.events = queue.Queue()
+        self.adaptive_enabled = False  # accepted for compatibility; a replay has fixed timing
+        self.polling = False
+        self._running = True
+        self._index = 0  # next snapshot to publish
+        self._trace_time = self.snapshots[0].ts if self.snapshots else time.time()
+        self._real_time = None  # monotonic time at which the clock was at _trace_time
+
+    def clock(self):
+        if self._real_time is None or not self.speed:
+            return self._trace_time
+        return self._trace_time + (time.monotonic() - self._real_time) * self.speed
+
+    def submit(self, command, *args):
+        self.commands.put((command, args))
+
+    def run(self):
+        while self._running:
+            timeout = None
+            if self.polling and self._index < len(self.snapshots):
+                if self.speed:
+                    timeout = max(0.0, (self.snapshots[self._index].ts - self.clock()) / self.speed)
+                else:
+                    timeout = 0.0 if self.events.qsize() < MAX_QUEUED else 0.01
+            try:
+                command, args = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                command = None
+            if command is not None:
+                self._handle(command)
+            elif self.polling:
+                self._publish()
+
+    def _publish(self):
+        while self._index < len(self.snapshots):
+            snapshot = self.snapshots[self._index]
+            if self.speed and snapshot.ts > self.clock():
+                return
+            if not self.speed:
+                if self.events.qsize() >= MAX_QUEUED:
+                    return
+                self._trace_time = snapshot.ts
+            self.events.put(('sample', snapshot))
+            self._index += 1
+        self.polling = False
+        self.events.put(('replay_done', self.path))
+        print(f"Replay of {self.path} finished ({len(self.snapshots)} samples)")
+
+    def _handle(self, command):
+        match command:
+            case 'connect':
+                first = next((s for s in self.snapshots if s.units is not None), None)
+                units = first.units if first else None
+                tip = next((s.tipseal_life for s in self.snapshots if s.tipseal_life is not None), None)
+                self.events.put(('connected', Snapshot(self._trace_time, units, None, None, None, tip, ())))
+            case 'start_monitoring':
+                self.polling = True
+                self._real_time = time.monotonic()
+            case 'stop_monitoring':
+                self._trace_time = self.clock()
+                self._real_time = None
+                self.polling = False
+            case 'start_pump':
+                self.events.put(('start_pump', {'status': None, 'turbo': None, 'started': False,
+                                                'error': ("Replay", "Pump commands are not available during a replay")}))
+            case 'stop_pump':
+                self.events.put(('stop_pump', {'error': ("Replay", "Pump commands are not available during a replay")}))
+            case 'close':
+                self._running = False
+                self.events.put(('closed', None))
+            case _:
+                pass  # set_adaptive, dump_trace: nothing to do for a recording
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pump_replay", description="Replay a pump wire trace")
+    parser.add_argument('trace', help="trace file written by pump_trace.dump_trace()")
+    parser.add_argument('--speed', type=float, default=60.0, help="replay speed-up (0 = as fast as possible)")
+    parser.add_argument('--address', type=lambda text: int(text, 0), default=None,
+                        help="only replay the pump with this address byte, e.g. 0x81 (default: all reads)")
+    parser.add_argument('--summary', action='store_true', help="print what the trace holds instead of opening the GUI")
+    args = parser.parse_args(argv)
+
+    replay = TraceReplay(args.trace, args.speed, args.address)
+    if args.summary:
+        snapshots = replay.snapshots
+        if not snapshots:
+            print("No poll batches in trace")
+            return 0
+        failed = sum(1 for s in snapshots if s.failed)
+        span = snapshots[-1].ts - snapshots[0].ts
+        print(f"{len(snapshots)} samples over {span:.1f} s "
+              f"({time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshots[0].ts))} onwards), {failed} with failures")
+        return 0
+
+    import tkinter as tk
+    from pump_gui import PumpGUI
+    root = tk.Tk()
+    PumpGUI(root, replay=replay)
+    root.mainloop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
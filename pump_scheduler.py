@@ -0,0 +1,174 @@
+# %%
+import math
+import time
+from collections import deque
+from pump_helpers import READ_FRAMES, WINDOWS, BAUD_RATE
+
+# Poll period per window in seconds; None = only on connect/start or after an error.
+DEFAULT_PERIODS = {
+    'pressure': 1.0,
+    'turbo_speed': 5.0,
+    'units': None,
+    'tipseal_life': 3600.0,
+}
+BITS_PER_CHAR = 10  # 8N1: start + 8 data + stop
+
+
+def wire_seconds(name, baud=BAUD_RATE):
+    """Time on the wire for one read of window `name` (command plus reply frame)."""
+    # reply: STX, address, window (3), read flag, data, ETX, CRC (2)
+    reply_len = 9 + WINDOWS[name].length
+    return (len(READ_FRAMES[name]) + reply_len) * BITS_PER_CHAR / baud
+
+
+class PollScheduler:
+    """Decides which windows are due on each poll cycle and tracks link usage.
+
+    Each window has its own period; windows that fall due within `slack`
+    seconds of each other are read together in one batch.
+    """
+
+    def __init__(self, periods=None, baud=BAUD_RATE, slack=0.05, window=60.0):
+        self.periods = dict(DEFAULT_PERIODS if periods is None else periods)
+        self.baud = baud
+        self.slack = slack
+        self.window = window  # seconds of history used by utilization()
+        self._next_due = {}
+        self._busy = deque()  # (monotonic start, seconds the link was busy)
+        self.reset()
+
+    def reset(self, now=None):
+        """Make every window, including on-demand ones, due immediately."""
+        now = time.monotonic() if now is None else now
+        self._next_due = {name: now for name in self.periods}
+
+    def request(self, name):
+        """Read `name` together with the next scheduled batch (e.g. units after an error)."""
+        others = [t for n, t in self._next_due.items() if n != name and t is not None]
+        self._next_due[name] = min(others) if others else time.monotonic()
+
+    def next_due(self):
+        """Monotonic time of the next batch, or None if nothing is scheduled."""
+        pending = [t for t in self._next_due.values() if t is not None]
+        return min(pending) if pending else None
+
+    def due(self, now):
+        """Names of the windows due at `now`."""
+        return tuple(name for name, t in self._next_due.items()
+                     if t is not None and t <= now + self.slack)
+
+    def set_period(self, name, period, now=None):
+        """Change the period of `name`; a shorter period takes effect immediately."""
+        now = time.monotonic() if now is None else now
+        self.periods[name] = period
+        nxt = self._next_due.get(name)
+        if period is not None and (nxt is None or nxt > now + period):
+            self._next_due[name] = now + period
+
+    def mark_done(self, names, now):
+        """Schedule the next read of each window in `names`, which was polled at `now`."""
+        for name in names:
+            period = self.periods[name]
+            if period is None:
+                self._next_due[name] = None
+                continue
+            nxt = self._next_due[name] + period
+            # after an overrun, skip ahead instead of bursting to catch up
+            self._next_due[name] = nxt if nxt > now else now + period
+
+    def record(self, start, seconds):
+        """Record that the link was busy for `seconds` starting at monotonic `start`."""
+        self._busy.append((start, seconds))
+        while self._busy and self._busy[0][0] < start - self.window:
+            self._busy.popleft()
+
+    def utilization(self):
+        """Measured fraction of time the link was busy over the last `window` seconds."""
+        return sum(s for _, s in self._busy) / self.window
+
+    def planned_utilization(self):
+        """Fraction of the link's capacity the periodic windows need at `baud`."""
+        return sum(wire_seconds(name, self.baud) / period
+                   for name, period in self.periods.items() if period)
+
+
+class AdaptiveRate:
+    """Speeds up pressure/turbo polling while the pump state is changing.
+
+    The slope of log10(pressure) and of turbo speed is measured over the last
+    `span` seconds. If either exceeds its threshold the pressure period drops
+    straight to `min_period`; once both are below half their threshold it
+    backs off by `backoff` per sample up to `max_period`. Turbo is polled
+    `turbo_ratio` times slower than pressure unless it is itself changing.
+    Periods are stretched to keep within `max_utilization` of the link, but
+    never past `max_period`.
+    """
+
+    def __init__(self, scheduler, min_period=0.25, max_period=10.0, pressure_slope=0.01,
+                 turbo_slope=50.0, span=10.0, backoff=1.25, turbo_ratio=5.0, max_utilization=0.5):
+        self.scheduler = scheduler
+        self.min_period = min_period  # seconds; sets the ceiling rate
+        self.max_period = max_period  # seconds; sets the floor rate
+        self.pressure_slope = pressure_slope  # decades per second
+        self.turbo_slope = turbo_slope  # rpm per second
+        self.span = span
+        self.backoff = backoff
+        self.turbo_ratio = turbo_ratio
+        self.max_utilization = max_utilization
+        self.base_periods = {name: scheduler.periods.get(name) for name in ('pressure', 'turbo_speed')}
+        self.period = self.base_periods['pressure'] or 1.0
+        self._log_pressures = deque()  # (ts, log10 pressure)
+        self._turbos = deque()  # (ts, rpm)
+        self._pressure_activity = 0.0  # slope / threshold
+        self._turbo_activity = 0.0
+
+    def reset(self):
+        """Forget history and restore the scheduler's original periods."""
+        self._log_pressures.clear()
+        self._turbos.clear()
+        self._pressure_activity = self._turbo_activity = 0.0
+        self.period = self.base_periods['pressure'] or 1.0
+        for name, period in self.base_periods.items():
+            self.scheduler.set_period(name, period)
+
+    def _slope(self, history, ts, value):
+        history.append((ts, value))
+        while len(history) > 2 and history[1][0] <= ts - self.span:
+            history.popleft()
+        t0, v0 = history[0]
+        return abs(value - v0) / (ts - t0) if ts > t0 else 0.0
+
+    def update(self, snapshot, now=None):
+        """Feed one snapshot and retune the scheduler's pressure/turbo periods."""
+        if snapshot.pressure is not None and snapshot.pressure > 0:
+            slope = self._slope(self._log_pressures, snapshot.ts, math.log10(snapshot.pressure))
+            self._pressure_activity = slope / self.pressure_slope
+        if snapshot.turbo_speed is not None:
+            slope = self._slope(self._turbos, snapshot.ts, snapshot.turbo_speed)
+            self._turbo_activity = slope / self.turbo_slope
+        if snapshot.pressure is None and snapshot.turbo_speed is None:
+            return
+        activity = max(self._pressure_activity, self._turbo_activity)
+
+        if activity >= 1.0:
+            self.period = self.min_period
+        elif activity < 0.5 and snapshot.pressure is not None:
+            # back off once per pressure sample so the rate decays smoothly
+            self.period = min(self.max_period, self.period * self.backoff)
+        if self._turbo_activity >= 1.0:
+            turbo_period = self.period
+        else:
+            turbo_period = min(self.max_period, self.period * self.turbo_ratio)
+
+        self.scheduler.set_period('pressure', self.period, now)
+        self.scheduler.set_period('turbo_speed', turbo_period, now)
+        # keep the link load bounded: stretch both periods until the plan fits,
+        # but never past max_period (the floor rate wins over the utilization cap)
+        while self.scheduler.planned_utilization() > self.max_utilization:
+            period = min(self.max_period, self.period * 2)
+            turbo_period, previous = min(self.max_period, turbo_period * 2), turbo_period
+            if period == self.period and turbo_period == previous:
+                break
+            self.period = period
+            self.scheduler.set_period('pressure', self.period, now)
+            self.scheduler.set_period('turbo_speed', turbo_period, now)
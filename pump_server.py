@@ -0,0 +1,303 @@
+# %%
+"""Share one pump connection between several processes: python -m pump_server
+
+The server opens the pump with open_comm() and listens on a localhost TCP
+port. Clients talk the pump's own frame protocol to it through pyserial's
+socket:// URL, so every pump_helpers function works unchanged:
+
+    ser = open_comm('socket://127.0.0.1:5760')   # or open_comm(): discovery tries the server first
+    python -m pump_daemon --port socket://127.0.0.1:5760
+
+Identical reads from several clients are coalesced into one wire
+transaction, and a reply is reused for `ttl` seconds. Writes always go to
+the pump and invalidate the cache. The server also polls the pump every
+`interval` seconds and broadcasts each Snapshot to subscribe() clients.
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+import serial
+from pump_helpers import (COMMAND_TIMEOUT, ETX, READ, READ_FRAMES, SERVER_URL, SNAPSHOT_WINDOWS, STX, Snapshot,
+                          _decode_value, _outcome, _transact, close_comm, discover_pump, make_snapshot, open_comm,
+                          set_serial)
+
+DEFAULT_HOST, DEFAULT_SERVER_PORT = SERVER_URL.split('://')[1].rsplit(':', 1)
+DEFAULT_SERVER_PORT = int(DEFAULT_SERVER_PORT)
+READ_TTL = 0.2  # seconds a read reply is served from the cache
+SUBSCRIBE = b'SUBSCRIBE\n'  # first line of a connection that wants the sample broadcast
+
+
+class _Pending:
+    """A read on the wire that other clients are waiting for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.frame = b''
+
+
+class PumpServer:
+    """Owns the pump connection and serves it to local clients (see module docstring).
+
+    `stats` counts wire transactions, cache hits, coalesced reads, writes and
+    connected clients, and is printed by the CLI.
+    """
+
+    def __init__(self, port=None, host=DEFAULT_HOST, server_port=DEFAULT_SERVER_PORT, ttl=READ_TTL,
+                 interval=1.0, names=SNAPSHOT_WINDOWS, reopen_interval=5.0):
+        self.port = port  # serial port; None = discover on first open
+        self.host = host
+        self.server_port = server_port
+        self.ttl = ttl
+        self.interval = interval  # broadcast poll period; 0 = no polling
+        self.names = names
+        self.reopen_interval = reopen_interval
+        self.ser = None
+        self.stats = dict.fromkeys(('wire', 'cache_hits', 'coalesced', 'writes', 'clients', 'subscribers'), 0)
+        self._lock = threading.Lock()  # cache, pending reads, subscribers, stats
+        self._wire_lock = threading.Lock()  # one transaction on the serial port at a time
+        self._cache = {}  # read frame -> (monotonic time, reply frame)
+        self._pending = {}  # read frame -> _Pending
+        self._generation = 0  # bumped by every write so older reads are not cached
+        self._subscribers = []
+        self._reopen_at = 0.0
+        self._running = False
+        self._threads = []
+        self._socket = None
+
+    def start(self):
+        """Open the pump, then start serving; returns the (host, port) listened on."""
+        self._open()
+        self._socket = socket.create_server((self.host, self.server_port))
+        self._socket.settimeout(0.2)
+        self._running = True
+        self._spawn(self._accept_loop)
+        if self.interval:
+            self._spawn(self._poll_loop)
+        return self._socket.getsockname()[:2]
+
+    def stop(self):
+        self._running = False
+        if self._socket is not None:
+            self._socket.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._threads.clear()
+        with self._lock:
+            for conn in self._subscribers:
+                conn.close()
+            self._subscribers.clear()
+        with self._wire_lock:
+            if self.ser is not None:
+                close_comm(self.ser)
+                self.ser = None
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, name="pump-server", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _open(self):
+        if self.port is None:
+            # discovery must not find this server (or another one) instead of the pump
+            self.ser = discover_pump(server=None)
+            set_serial(self.ser)
+        else:
+            self.ser = open_comm(self.port)
+        self.port = self.ser.port
+
+    def _wire(self, cmd):
+        """One transaction on the serial port (b'' if it is closed or fails)."""
+        with self._wire_lock:
+            if self.ser is None:
+                if time.monotonic() < self._reopen_at:
+                    return b''
+                try:
+                    self._open()
+                    print(f"Reopened {self.port}")
+                except Exception as e:
+                    self._reopen_at = time.monotonic() + self.reopen_interval
+                    print(f"Could not reopen {self.port}: {e}")
+                    return b''
+            self.stats['wire'] += 1
+            try:
+                return _transact(self.ser, cmd)
+            except (serial.SerialException, OSError) as e:
+                print(f"Serial error: {e}")
+                try:
+                    close_comm(self.ser)
+                except Exception:
+                    pass
+                self.ser = None
+                self._reopen_at = time.monotonic() + self.reopen_interval
+                return b''
+
+    def transact(self, cmd):
+        """Reply frame for command frame `cmd`, coalescing and caching reads."""
+        if cmd[5:6] != READ:
+            with self._lock:
+                self._cache.clear()
+                self._generation += 1
+                self.stats['writes'] += 1
+            return self._wire(cmd)
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(cmd)
+            if hit is not None and now - hit[0] <= self.ttl:
+                self.stats['cache_hits'] += 1
+                return hit[1]
+            pending = self._pending.get(cmd)
+            owner = pending is None
+            if owner:
+                pending = self._pending[cmd] = _Pending()
+                generation = self._generation
+            else:
+                self.stats['coalesced'] += 1
+        if not owner:
+            # another client's identical read is on the wire; share its reply
+            pending.done.wait(2 * COMMAND_TIMEOUT)
+            return pending.frame
+        frame = b''
+        try:
+            frame = self._wire(cmd)
+        finally:
+            with self._lock:
+                if generation == self._generation and _outcome(cmd, frame) == 'ok':
+                    self._cache[cmd] = (now, frame)
+                del self._pending[cmd]
+            pending.frame = frame
+            pending.done.set()
+        return frame
+
+    def poll(self):
+        """Read self.names through the cache and broadcast the Snapshot to subscribers."""
+        ts = time.time()
+        values = {name: _decode_value(name, self.transact(READ_FRAMES[name])) for name in self.names}
+        snapshot = make_snapshot(ts, self.names, values)
+        self.broadcast(snapshot)
+        return snapshot
+
+    def broadcast(self, snapshot):
+        line = (json.dumps(snapshot._asdict()) + '\n').encode()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for conn in subscribers:
+            try:
+                conn.sendall(line)
+            except OSError:
+                # gone, or too slow to keep up
+                with self._lock:
+                    if conn in self._subscribers:
+                        self._subscribers.remove(conn)
+                        self.stats['subscribers'] -= 1
+                conn.close()
+
+    def _poll_loop(self):
+        next_poll = time.monotonic()
+        while self._running:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling pump: {e}")
+            next_poll = max(next_poll + self.interval, time.monotonic())
+            time.sleep(max(0.0, next_poll - time.monotonic()))
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(conn,), name="pump-server-client", daemon=True).start()
+
+    def _serve(self, conn):
+        """Answer one client's command frames until it disconnects."""
+        with self._lock:
+            self.stats['clients'] += 1
+        buffer = bytearray()
+        try:
+            while self._running:
+                try:
+                    data = conn.recv(4096)
+                except OSError:
+                    return
+                if not data:
+                    return
+                buffer += data
+                if len(buffer) < len(SUBSCRIBE) and SUBSCRIBE.startswith(buffer):
+                    continue  # wait for the rest of the line
+                if buffer.startswith(SUBSCRIBE):
+                    conn.settimeout(1.0)  # a stalled subscriber is dropped, not waited for
+                    with self._lock:
+                        self._subscribers.append(conn)
+                        self.stats['subscribers'] += 1
+                    conn = None  # owned by the broadcast list now
+                    return
+                while True:
+                    start = buffer.find(STX)
+                    if start < 0:
+                        buffer.clear()
+                        break
+                    end = buffer.find(ETX, start + 1)
+                    if end < 0 or len(buffer) < end + 3:
+                        del buffer[:start]
+                        break
+                    frame = bytes(buffer[start:end + 3])
+                    del buffer[:end + 3]
+                    reply = self.transact(frame)
+                    if reply:
+                        try:
+                            conn.sendall(reply)
+                        except OSError:
+                            return  # client went away mid-reply; closed below
+        finally:
+            with self._lock:
+                self.stats['clients'] -= 1
+            if conn is not None:
+                conn.close()
+
+
+def subscribe(host=DEFAULT_HOST, port=DEFAULT_SERVER_PORT, timeout=None):
+    """Yield each Snapshot broadcast by a running PumpServer until it goes away."""
+    with socket.create_connection((host, port), timeout=timeout) as conn:
+        conn.sendall(SUBSCRIBE)
+        with conn.makefile('rb') as lines:
+            for line in lines:
+                fields = json.loads(line)
+                fields['failed'] = tuple(fields['failed'])
+                yield Snapshot(**fields)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pump_server", description="Share the pump between local processes")
+    parser.add_argument('--port', default=None, help="serial port of the pump (default: cached port, then probe all ports)")
+    parser.add_argument('--listen', default=f"{DEFAULT_HOST}:{DEFAULT_SERVER_PORT}",
+                        help=f"host:port to serve on (default {DEFAULT_HOST}:{DEFAULT_SERVER_PORT})")
+    parser.add_argument('--ttl', type=float, default=READ_TTL, help=f"seconds a read is served from cache (default {READ_TTL})")
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help="seconds between broadcast polls (default 1; 0 = only answer clients)")
+    parser.add_argument('--stats-interval', type=float, default=60.0, help="seconds between stats lines (0 = never)")
+    args = parser.parse_args(argv)
+
+    host, port = args.listen.rsplit(':', 1)
+    server = PumpServer(args.port, host, int(port), args.ttl, args.interval)
+    host, port = server.start()
+    print(f"Serving {server.port} on socket://{host}:{port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(args.stats_interval or 3600)
+            if args.stats_interval:
+                print(', '.join(f"{key} {value}" for key, value in server.stats.items()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+# %%
+import datetime
+import math
+import mmap
+import os
+import struct
+import time
+import numpy as np
+
+# One fixed-width record per sample: unix time, pressure, turbo speed (NaN if unknown).
+RECORD = struct.Struct('<ddd')
+SEGMENT_SUFFIX = '.bin'
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pump_data')
+
+
+def segment_name(ts):
+    """Segment file name for unix time `ts` (one file per local calendar day)."""
+    return datetime.date.fromtimestamp(ts).isoformat() + SEGMENT_SUFFIX
+
+
+class TimeSeriesStore:
+    """Append-only on-disk store of (ts, pressure, turbo) samples.
+
+    Records are RECORD.size bytes each, in day-rotated segment files named
+    YYYY-MM-DD.bin. Appends are buffered in memory and written every
+    `buffer_records` samples, or sooner once `fsync_interval` seconds have
+    passed since the last fsync, which is then done with the write. A crash
+    thus loses at most the samples appended in the last `fsync_interval`
+    seconds (plus any buffered while no further sample arrived).
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, buffer_records=64, fsync_interval=10.0):
+        self.directory = directory
+        self.buffer_records = buffer_records
+        self.fsync_interval = fsync_interval
+        self._buffer = bytearray()
+        self._file = None
+        self._segment = None
+        self._last_fsync = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, ts, pressure, turbo=None):
+        """Queue one sample for writing; rotates to a new segment at midnight."""
+        name = segment_name(ts)
+        if name != self._segment:
+            self.flush(fsync=True)
+            self._open_segment(name)
+        self._buffer += RECORD.pack(ts, pressure, math.nan if turbo is None else turbo)
+        if (len(self._buffer) >= self.buffer_records * RECORD.size
+                or time.monotonic() - self._last_fsync >= self.fsync_interval):
+            self.flush()
+
+    def flush(self, fsync=False):
+        """Write buffered records; fsync if asked or if `fsync_interval` has passed."""
+        if self._file is None:
+            return
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+        now = time.monotonic()
+        if fsync or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+    def close(self):
+        self.flush(fsync=True)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._segment = None
+
+    def _open_segment(self, name):
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(self.directory, name)
+        self._file = open(path, 'ab')
+        # drop a partial record left by a crash mid-write
+        size = self._file.tell()
+        if size % RECORD.size:
+            self._file.truncate(size - size % RECORD.size)
+            self._file.seek(0, os.SEEK_END)
+        self._segment = name
+
+
+def query(start, end, directory=DEFAULT_DIR):
+    """Samples with start <= ts < end from the store, as (times, pressures, turbos) float64 arrays.
+
+    Only the segments covering the range are opened. Each is memory-mapped
+    and viewed as an (n, 3) array, the range is found by binary search on
+    the time column, and only those rows are copied out, so weeks of history
+    load without a Python loop over the records. Turbo is NaN where it was
+    not recorded.
+    """
+    chunks = []
+    if os.path.isdir(directory):
+        first, last = segment_name(start), segment_name(end)
+        names = sorted(n for n in os.listdir(directory)
+                       if n.endswith(SEGMENT_SUFFIX) and first <= n <= last)
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as f:
+                count = os.fstat(f.fileno()).st_size // RECORD.size
+                if count == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    records = np.frombuffer(mm, dtype='<f8', count=count * 3).reshape(count, 3)
+                    i, j = np.searchsorted(records[:, 0], (start, end))
+                    chunks.append(records[i:j].copy())
+                    del records  # the mmap can't close while an array still views it
+    rows = np.concatenate(chunks) if chunks else np.empty((0, 3))
+    return rows[:, 0], rows[:, 1], rows[:, 2]
+
+
+def load_recent(seconds, directory=DEFAULT_DIR):
+    """Samples from the last `seconds` seconds, e.g. to refill the plot after a restart."""
+    now = time.time()
+    return query(now - seconds, now + 1, directory)
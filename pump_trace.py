@@ -0,0 +1,128 @@
+# %%
+import datetime
+import os
+import struct
+import threading
+import time
+
+DEFAULT_TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pump_traces')
+TX, RX = 0, 1  # record direction; an RX record with no data is a reply timeout
+MAX_DATA = 30  # bytes kept per frame (pump frames are at most 19)
+# monotonic time, direction, data length, data
+TRACE_RECORD = struct.Struct(f'<dBB{MAX_DATA}s')
+# magic, wall-clock time and monotonic time of the same instant, record count
+TRACE_HEADER = struct.Struct('<8sddI')
+TRACE_MAGIC = b'PUMPTRC1'
+TRACE_SECONDS = 24 * 3600  # capture window the default ring is sized for
+# a TX and an RX record per read at the default periods (pressure every 1 s, turbo every 5 s)
+RECORDS_PER_SECOND = 2.5
+
+
+def capacity_for(seconds, records_per_second=RECORDS_PER_SECOND):
+    """Ring capacity (records) holding `seconds` of traffic at `records_per_second`."""
+    return max(1, int(seconds * records_per_second))
+
+
+class WireTrace:
+    """Fixed-size binary ring buffer of every frame sent to and received from the pump.
+
+    Each frame is one TRACE_RECORD.size-byte record with its time.monotonic()
+    timestamp, packed into a preallocated bytearray, so recording costs no
+    allocation and no console output. Once full, the oldest records are
+    overwritten. dump() writes the buffered records to a file.
+
+    The default capacity holds TRACE_SECONDS (24 h) at the default poll
+    periods, about 8.6 MB. Faster polling shortens the window: with
+    adaptive sampling at its 0.25 s minimum it is about 7 h. Use
+    capacity_for() with resize() (the daemon's --trace-hours) to size it
+    for another window.
+    """
+
+    def __init__(self, capacity=capacity_for(TRACE_SECONDS)):
+        self.capacity = capacity
+        self.enabled = True
+        self._buf = bytearray(capacity * TRACE_RECORD.size)
+        self._next = 0  # slot the next record goes into
+        self._count = 0
+        self._lock = threading.Lock()  # discovery probes record from several threads
+
+    def __len__(self):
+        return self._count
+
+    def record(self, direction, data, ts=None):
+        if not self.enabled:
+            return
+        ts = time.monotonic() if ts is None else ts
+        with self._lock:
+            TRACE_RECORD.pack_into(self._buf, self._next * TRACE_RECORD.size,
+                                   ts, direction, min(len(data), MAX_DATA), bytes(data[:MAX_DATA]))
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def resize(self, capacity):
+        """Change the capacity, keeping the newest records that fit."""
+        with self._lock:
+            data, count = self._ordered_locked()
+            keep = min(count, capacity)
+            self.capacity = capacity
+            self._buf = bytearray(capacity * TRACE_RECORD.size)
+            self._buf[:keep * TRACE_RECORD.size] = data[(count - keep) * TRACE_RECORD.size:]
+            self._count = keep
+            self._next = keep % capacity
+
+    def clear(self):
+        with self._lock:
+            self._next = self._count = 0
+
+    def _ordered(self):
+        """The buffered records as bytes, oldest first."""
+        with self._lock:
+            return self._ordered_locked()
+
+    def _ordered_locked(self):
+        size = TRACE_RECORD.size
+        if self._count < self.capacity:
+            return bytes(self._buf[:self._count * size]), self._count
+        split = self._next * size
+        return bytes(self._buf[split:]) + bytes(self._buf[:split]), self._count
+
+    def records(self):
+        """[(monotonic ts, direction, data), ...] oldest first."""
+        data, count = self._ordered()
+        return _unpack(data, count)
+
+    def dump(self, path):
+        """Write the buffered records to `path` (see load_trace) and return the path."""
+        data, count = self._ordered()
+        with open(path, 'wb') as f:
+            f.write(TRACE_HEADER.pack(TRACE_MAGIC, time.time(), time.monotonic(), count))
+            f.write(data)
+        return path
+
+
+def _unpack(data, count):
+    records = []
+    for ts, direction, length, raw in TRACE_RECORD.iter_unpack(data[:count * TRACE_RECORD.size]):
+        records.append((ts, direction, raw[:length]))
+    return records
+
+
+def load_trace(path):
+    """Read a dumped trace: returns (wall time, monotonic time of that instant, records)."""
+    with open(path, 'rb') as f:
+        magic, wall, mono, count = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+        if magic != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a pump wire trace")
+        return wall, mono, _unpack(f.read(), count)
+
+
+def dump_trace(directory=DEFAULT_TRACE_DIR, reason='manual', trace=None):
+    """Dump `trace` (default: TRACE) to a timestamped file in `directory`; returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(directory, f"pump_trace_{stamp}_{reason}.bin")
+    return (TRACE if trace is None else trace).dump(path)
+
+
+# Default trace for pump_helpers' exchanges.
+TRACE = WireTrace()
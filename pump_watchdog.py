@@ -0,0 +1,164 @@
+# %%
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import time
+from collections import deque
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pump_profiles')
+STALL_SECONDS = 1.0  # a callback starting this late is reported as a stall
+
+
+def _percentile(values, q):
+    """q-th percentile (0-100) of `values`, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class CallbackStats:
+    """Recent lag (how late it started) and run time of one scheduled callback."""
+
+    def __init__(self, recent=512):
+        self.count = 0
+        self.lag = deque(maxlen=recent)
+        self.run = deque(maxlen=recent)
+        self.lag_max = 0.0
+        self.run_max = 0.0
+
+    def add(self, lag, run):
+        self.count += 1
+        self.lag.append(lag)
+        self.run.append(run)
+        self.lag_max = max(self.lag_max, lag)
+        self.run_max = max(self.run_max, run)
+
+
+class LoopMonitor:
+    """Measures how late each Tk `after` callback fires and how long it runs.
+
+    Schedule with after() instead of root.after(): the callback is wrapped to
+    record its lag (actual start minus scheduled time) and run time under
+    `name`. Everything on the Tk loop (other callbacks, event handlers, a
+    modal dialog) delays the next callback, so lag shows any stall of the
+    loop, and the run times show which callback is the slow one. A start
+    more than `stall_after` s late is kept in `stalls` along with the
+    callback that ran just before it; if that one was quick, the loop was
+    blocked by something else.
+    """
+
+    def __init__(self, stall_after=STALL_SECONDS):
+        self.stall_after = stall_after
+        self.stats = {}  # name -> CallbackStats
+        # (wall time, name, lag, previous callback, its run time)
+        self.stalls = deque(maxlen=20)
+        self._previous = (None, 0.0)
+
+    def after(self, root, delay_ms, callback, name=None):
+        """root.after(delay_ms, callback), instrumented; returns the after id."""
+        name = name or getattr(callback, '__name__', 'callback')
+        due = time.perf_counter() + delay_ms / 1000.0
+
+        def run():
+            start = time.perf_counter()
+            lag = max(0.0, start - due)
+            try:
+                callback()
+            finally:
+                end = time.perf_counter()
+                self.record(name, lag, end - start)
+
+        return root.after(delay_ms, run)
+
+    def record(self, name, lag, run):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = CallbackStats()
+        stats.add(lag, run)
+        if lag >= self.stall_after:
+            previous, previous_run = self._previous
+            self.stalls.append((time.time(), name, lag, previous, previous_run))
+            print(f"Event loop stalled: {name} ran {lag:.2f} s late"
+                  + (f" (before it, {previous} ran {previous_run * 1000:.0f} ms)" if previous else ""))
+        self._previous = (name, run)
+
+    def summary(self):
+        """{name: {count, lag/run p50/p95/max in ms}} over the recent calls."""
+        ms = lambda seconds: None if seconds is None else seconds * 1000
+        return {name: {
+            'count': s.count,
+            'lag_p50_ms': ms(_percentile(s.lag, 50)),
+            'lag_p95_ms': ms(_percentile(s.lag, 95)),
+            'lag_max_ms': s.lag_max * 1000,
+            'run_p50_ms': ms(_percentile(s.run, 50)),
+            'run_p95_ms': ms(_percentile(s.run, 95)),
+            'run_max_ms': s.run_max * 1000,
+        } for name, s in self.stats.items()}
+
+
+class ProfileCapture:
+    """On-demand cProfile of the thread that calls start() (the Tk thread in the GUI).
+
+    start(seconds) begins a capture; the caller ends it with stop() once
+    due() says the time is up (or earlier). stop() writes a text report
+    (top functions by cumulative and by own time, plus the loop summary if
+    a LoopMonitor is given) and the raw .prof file to `directory`.
+    """
+
+    def __init__(self, directory=DEFAULT_PROFILE_DIR, monitor=None):
+        self.directory = directory
+        self.monitor = monitor
+        self._profile = None
+        self._started = None  # (wall time, monotonic time)
+        self._until = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self, seconds):
+        if self.running:
+            return
+        self._profile = cProfile.Profile()
+        self._started = (time.time(), time.monotonic())
+        self._until = time.monotonic() + seconds
+        self._profile.enable()
+
+    def due(self, now=None):
+        """True if a capture is running and its time is up."""
+        return self.running and (time.monotonic() if now is None else now) >= self._until
+
+    def stop(self):
+        """Finish the capture now and write it; returns the report path (None if not running)."""
+        if not self.running:
+            return None
+        profile, self._profile = self._profile, None
+        profile.disable()
+        wall, mono = self._started
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.datetime.fromtimestamp(wall).strftime('%Y%m%d_%H%M%S')
+        base = os.path.join(self.directory, f"pump_profile_{stamp}")
+        profile.dump_stats(base + '.prof')
+        out = io.StringIO()
+        out.write(f"Profile of the GUI thread from {datetime.datetime.fromtimestamp(wall).isoformat(timespec='seconds')} "
+                  f"for {time.monotonic() - mono:.1f} s\n\n")
+        if self.monitor is not None:
+            out.write("Event loop (ms):\n")
+            for name, m in self.monitor.summary().items():
+                out.write(f"  {name}: {m['count']} calls, lag p50 {m['lag_p50_ms']:.1f} p95 {m['lag_p95_ms']:.1f} "
+                          f"max {m['lag_max_ms']:.1f}, run p50 {m['run_p50_ms']:.1f} p95 {m['run_p95_ms']:.1f} "
+                          f"max {m['run_max_ms']:.1f}\n")
+            for ts, name, lag, previous, previous_run in self.monitor.stalls:
+                out.write(f"  stall {time.strftime('%H:%M:%S', time.localtime(ts))}: {name} {lag:.2f} s late"
+                          + (f", after {previous} ran {previous_run * 1000:.0f} ms" if previous else "") + "\n")
+            out.write("\n")
+        stats = pstats.Stats(profile, stream=out)
+        for key in ('cumulative', 'tottime'):
+            out.write(f"Top functions by {key} time:\n")
+            stats.sort_stats(key).print_stats(40)
+        with open(base + '.txt', 'w') as f:
+            f.write(out.getvalue())
+        return base + '.txt'
@@ -0,0 +1,339 @@
+# %%
+import queue
+import threading
+import time
+from pump_helpers import ADDRESS, PumpClient
+from pump_scheduler import PollScheduler, AdaptiveRate
+from pump_metrics import METRICS
+from pump_trace import dump_trace, DEFAULT_TRACE_DIR
+
+PUMP_STATUS = {0: "Stopped", 1: "Running"}
+# connection states reported in 'link_state' events
+LINK_STATES = ('disconnected', 'connected', 'degraded', 'reconnecting')
+
+
+class AcquisitionWorker(threading.Thread):
+    """Background thread that owns one pump's connection (a PumpClient) and does all its I/O.
+
+    The GUI (or any other caller) sends commands with `submit()`; they run in
+    order with the polls, which a PollScheduler spreads over the windows at
+    their own rates. Results are published on `events` as
+    `(kind, payload)` tuples for the caller to drain from its own loop:
+
+        ('connected', Snapshot)   port opened (snapshot.units is None if the pump did not answer)
+        ('connect_error', message)  initial connect failed (retried in the background)
+        ('link_state', {'state', 'failures', 'retry_in', 'error'})   on every state change
+        ('sample', Snapshot)      see pump_helpers.poll_snapshot; windows not due are None
+        ('poll_error', message)
+        ('link_stats', {'utilization', 'planned', 'baud', 'pressure_period', 'windows'})
+                                  windows: pump_metrics.LinkMetrics.summary()
+        ('start_pump', {'status', 'turbo', 'started', 'error'})
+        ('stop_pump', {'error'})
+        ('trace_dumped', {'path', 'reason', 'error'})   wire trace written (on request or after a poll error)
+        ('closed', None)
+
+    The connection is a small state machine (LINK_STATES). A failed poll
+    makes it 'degraded'; `reconnect_after` failed polls in a row, or a port
+    error, close the port and make it 'reconnecting'. The port is then
+    reopened in the background with exponential backoff (`backoff` = first
+    and longest delay) and polling resumes where it left off. A failed
+    initial connect is retried the same way.
+
+    Run one worker per pump to monitor several: each polls on its own
+    thread, so a slow or dead pump never delays the others.
+    """
+
+    def __init__(self, periods=None, stats_interval=5.0, adaptive=None, store=None, logger=None, port=None,
+                 metrics_path=None, trace_dir=DEFAULT_TRACE_DIR, trace_dump_interval=60.0,
+                 reconnect_after=2, backoff=(0.5, 30.0), address=ADDRESS, name=None):
+        super().__init__(name="pump-acquisition" if name is None else f"pump-acquisition-{name}", daemon=True)
+        # port None = auto-discover (cached port first); address: the pump's address byte
+        self.client = PumpClient(port, address)
+        self.store = store  # optional TimeSeriesStore; every pressure sample is appended
+        self.logger = logger  # optional StreamLogger; every snapshot is logged
+        self.metrics_path = metrics_path  # optional Prometheus text file, rewritten with every 'link_stats'
+        self.trace_dir = trace_dir  # where wire traces are dumped (None disables dumping)
+        self.trace_dump_interval = trace_dump_interval  # seconds; at most one automatic dump per interval
+        self._last_trace_dump = None
+        self._trace_armed = True  # dump once per run of failures, re-armed by a good sample
+        self._last_turbo = None
+        self.scheduler = PollScheduler(periods)
+        # adaptive: None (fixed periods) or AdaptiveRate keyword arguments
+        self.adaptive = AdaptiveRate(self.scheduler, **(adaptive or {}))
+        self.adaptive_enabled = adaptive is not None
+        self.stats_interval = stats_interval  # seconds between 'link_stats' events
+        self.commands = queue.Queue()
+        self.events = queue.Queue()
+        self.polling = False
+        self._running = True
+        self.link_state = 'disconnected'
+        self.reconnect_after = reconnect_after  # consecutive failed polls before reopening the port
+        self.backoff = backoff  # (first, longest) seconds between reopen attempts
+        self._failures = 0  # consecutive failed polls
+        self._reconnect_at = None  # monotonic time of the next reopen attempt
+        self._reconnect_delay = backoff[0]
+        self._last_stats = time.monotonic()
+
+    def submit(self, command, *args):
+        """Queue a command ('connect', 'start_monitoring', 'stop_monitoring',
+        'start_pump', 'stop_pump', 'set_adaptive' (enabled), 'dump_trace' or 'close') for the worker."""
+        self.commands.put((command, args))
+
+    def run(self):
+        while self._running:
+            timeout = None
+            next_due = self.scheduler.next_due()
+            if self._reconnect_at is not None:
+                timeout = max(0.0, self._reconnect_at - time.monotonic())
+            elif self.polling and self.client.is_open and next_due is not None:
+                timeout = max(0.0, next_due - time.monotonic())
+            try:
+                command, args = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                command = None
+            if command is not None:
+                self._handle(command, args)
+                continue
+            if self._reconnect_at is not None:
+                if time.monotonic() >= self._reconnect_at:
+                    self._reconnect()
+            elif self.polling and self.client.is_open:
+                self._poll()
+
+    def _handle(self, command, args):
+        match command:
+            case 'connect': self._connect()
+            case 'start_monitoring':
+                self.polling = True
+                self.adaptive.reset()
+                self.scheduler.reset()
+            case 'set_adaptive':
+                self.adaptive_enabled = bool(args[0])
+                self.adaptive.reset()
+            case 'stop_monitoring':
+                self.polling = False
+                self._flush_store()
+            case 'start_pump': self._start_pump()
+            case 'stop_pump': self._stop_pump()
+            case 'dump_trace': self._dump_trace('manual')
+            case 'close': self._close()
+            case _: print(f"Unknown worker command: {command}")
+
+    def _connect(self):
+        if self.client.is_open:
+            return
+        try:
+            self._open(require_reply=False)
+        except Exception as e:
+            self.events.put(('connect_error', str(e)))
+            self._schedule_reconnect(str(e))
+
+    def _open(self, require_reply):
+        """Open the port and read units and tip seal life (a reconnect also needs the units to answer)."""
+        self.client.open()
+        try:
+            # sample tip seal life immediately on connection
+            snapshot = self.client.poll_snapshot(('units', 'tipseal_life'), stop_on_timeout=True)
+        except Exception:
+            self.client.close()
+            raise
+        if require_reply and snapshot.units is None:
+            self.client.close()
+            raise ConnectionError("Pump did not answer after reopening the port")
+        self._failures = 0
+        self._reconnect_at = None
+        self._reconnect_delay = self.backoff[0]
+        self._persist(snapshot)
+        self.events.put(('connected', snapshot))
+        self._set_link_state('connected')
+
+    def _reconnect(self):
+        self._reconnect_at = None
+        try:
+            self._open(require_reply=True)
+        except Exception as e:
+            self._schedule_reconnect(str(e))
+            return
+        # everything (units included) is due again; history is untouched
+        self.scheduler.reset()
+
+    def _schedule_reconnect(self, reason):
+        """Drop the port and try to reopen it after the current backoff delay."""
+        if self.client.is_open:
+            try:
+                self.client.close()
+            except Exception as e:
+                print(f"Error closing serial connection: {e}")
+        delay = self._reconnect_delay
+        self._reconnect_at = time.monotonic() + delay
+        self._reconnect_delay = min(self.backoff[1], delay * 2)
+        self._set_link_state('reconnecting', retry_in=delay, error=reason)
+
+    def _set_link_state(self, state, retry_in=None, error=None):
+        if state == self.link_state and state != 'reconnecting':
+            return
+        self.link_state = state
+        self.events.put(('link_state', {'state': state, 'failures': self._failures,
+                                        'retry_in': retry_in, 'error': error}))
+
+    def _poll_failed(self, reason, port_error=False):
+        self._failures += 1
+        if port_error or self._failures >= self.reconnect_after:
+            self._schedule_reconnect(reason)
+        else:
+            self._set_link_state('degraded', error=reason)
+
+    def _poll(self):
+        """Read the windows that are due and publish them as one sample."""
+        now = time.monotonic()
+        names = self.scheduler.due(now)
+        if not names:
+            return
+        try:
+            snapshot = self.client.poll_snapshot(names, stop_on_timeout=True)
+            self.scheduler.mark_done(names, now)
+            if self.adaptive_enabled:
+                self.adaptive.update(snapshot, now)
+            self._persist(snapshot)
+            self.events.put(('sample', snapshot))
+            if snapshot.failed:
+                # units are only re-read on connect/start or after an error
+                self.scheduler.request('units')
+                self._dump_trace('error')
+                self._poll_failed(f"No reply for {', '.join(snapshot.failed)}")
+            else:
+                self._trace_armed = True
+                self._failures = 0
+                self._set_link_state('connected')
+        except Exception as e:
+            self.scheduler.mark_done(names, now)
+            self.scheduler.request('units')
+            print(f"Error reading pressure: {e}")
+            self.events.put(('poll_error', str(e)))
+            self._dump_trace('error')
+            self._poll_failed(str(e), port_error=True)
+        end = time.monotonic()
+        self.scheduler.record(now, end - now)
+        if end - self._last_stats >= self.stats_interval:
+            self._last_stats = end
+            self._publish_stats()
+
+    def _publish_stats(self):
+        self.events.put(('link_stats', {'utilization': self.scheduler.utilization(),
+                                        'planned': self.scheduler.planned_utilization(),
+                                        'baud': self.scheduler.baud,
+                                        'pressure_period': self.scheduler.periods['pressure'],
+                                        'windows': METRICS.summary()}))
+        self._write_metrics()
+
+    def _write_metrics(self):
+        if self.metrics_path is None:
+            return
+        try:
+            METRICS.write_prometheus(self.metrics_path)
+        except Exception as e:
+            print(f"Error writing metrics file: {e}")
+
+    def _persist(self, snapshot):
+        """Log the snapshot and append its pressure (with the latest turbo reading) to the store."""
+        if snapshot.turbo_speed is not None:
+            self._last_turbo = snapshot.turbo_speed
+        # a disk problem must not stop acquisition
+        if self.logger is not None:
+            try:
+                self.logger.write(snapshot)
+            except Exception as e:
+                print(f"Error writing log: {e}")
+        if self.store is None or snapshot.pressure is None:
+            return
+        try:
+            self.store.append(snapshot.ts, snapshot.pressure, self._last_turbo)
+        except Exception as e:
+            print(f"Error writing sample store: {e}")
+
+    def _flush_store(self):
+        try:
+            if self.store is not None:
+                self.store.flush(fsync=True)
+            if self.logger is not None:
+                self.logger.flush()
+        except Exception as e:
+            print(f"Error flushing sample store: {e}")
+
+    def _start_pump(self):
+        """Start the pump only if it reports stopped with the turbo at 0 rpm."""
+        result = {'status': None, 'turbo': None, 'started': False, 'error': None}
+        if not self.client.is_open:
+            result['error'] = ("Pump Error", f"Pump not connected ({self.link_state})")
+            self.events.put(('start_pump', result))
+            return
+        try:
+            values = self.client.read_windows(('start_stop', 'turbo_speed'))
+        except Exception as e:
+            result['error'] = ("Pump Status Error", f"Failed to read pump status:\n{e}")
+            self.events.put(('start_pump', result))
+            return
+        result['status'] = PUMP_STATUS.get(values['start_stop'], "Unknown")
+        result['turbo'] = values['turbo_speed']
+        if result['turbo'] == 0:
+            try:
+                if not self.client.start_pump():
+                    raise Exception("Pump did not acknowledge start command")
+                result['started'] = True
+            except Exception as e:
+                result['error'] = ("Pump Error", f"Failed to send start command:\n{e}")
+        self.events.put(('start_pump', result))
+
+    def _stop_pump(self):
+        result = {'error': None}
+        if not self.client.is_open:
+            result['error'] = ("Pump Error", f"Pump not connected ({self.link_state})")
+            self.events.put(('stop_pump', result))
+            return
+        try:
+            self.client.stop_pump()
+        except Exception as e:
+            result['error'] = ("Pump Error", f"Failed to send stop command:\n{e}")
+        self.events.put(('stop_pump', result))
+
+    def _dump_trace(self, reason):
+        """Write the wire trace to trace_dir.
+
+        Automatic ('error') dumps happen once per run of failed polls and at
+        most once per trace_dump_interval, so a dead link does not fill the disk.
+        """
+        if self.trace_dir is None:
+            return
+        now = time.monotonic()
+        if reason == 'error':
+            if not self._trace_armed:
+                return
+            if self._last_trace_dump is not None and now - self._last_trace_dump < self.trace_dump_interval:
+                return
+            self._trace_armed = False
+            self._last_trace_dump = now
+        result = {'path': None, 'reason': reason, 'error': None}
+        try:
+            result['path'] = dump_trace(self.trace_dir, reason)
+        except Exception as e:
+            print(f"Error dumping wire trace: {e}")
+            result['error'] = str(e)
+        self.events.put(('trace_dumped', result))
+
+    def _close(self):
+        self.polling = False
+        self._running = False
+        self._reconnect_at = None
+        self._write_metrics()
+        for sink in (self.store, self.logger):
+            if sink is not None:
+                try:
+                    sink.close()
+                except Exception as e:
+                    print(f"Error closing {type(sink).__name__}: {e}")
+        if self.client.is_open:
+            try:
+                self.client.close()
+            except Exception as e:
+                print(f"Error closing serial connection: {e}")
+        self.events.put(('closed', None))
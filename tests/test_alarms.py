@@ -0,0 +1,45 @@
+import queue
+import time
+from pump_alarms import AlarmEngine, default_rules, stale_after_for
+from pump_emulator import PumpEmulator, PumpModel
+from pump_worker import AcquisitionWorker
+
+
+def test_no_stale_alarm_at_max_period():
+    """A worker backed off to the slowest adaptive period never trips the stale-data alarm.
+
+    Periods are scaled down (0.5 s instead of 10 s) so the test runs in seconds;
+    the threshold comes from stale_after_for() exactly as the GUI and daemon do.
+    """
+    max_period = 0.5
+    model = PumpModel(start_pressure=5e-8, base_pressure=5e-8, running=True)  # steady: rate backs off fully
+    emulator = PumpEmulator(model)
+    host, port = emulator.start_tcp()
+    worker = AcquisitionWorker({'pressure': max_period, 'turbo_speed': max_period, 'units': None, 'tipseal_life': None},
+                               adaptive={'min_period': 0.1, 'max_period': max_period, 'backoff': 10.0},
+                               port=f"socket://{host}:{port}", trace_dir=None)
+    events = []
+    alarms = AlarmEngine(default_rules(stale_after=stale_after_for(max_period, minimum=0.0)), [events.append])
+    samples = 0
+    try:
+        worker.start()
+        worker.submit('connect')
+        worker.submit('start_monitoring')
+        alarms.restart(time.time())
+        end = time.monotonic() + 8 * max_period
+        while time.monotonic() < end:
+            alarms.check(time.time())
+            try:
+                kind, payload = worker.events.get(timeout=0.02)
+            except queue.Empty:
+                continue
+            if kind == 'sample':
+                alarms.update(payload)
+                samples += payload.pressure is not None
+        assert worker.scheduler.periods['pressure'] == max_period
+    finally:
+        worker.submit('close')
+        worker.join(timeout=2.0)
+        emulator.stop()
+    assert samples >= 4
+    assert [e for e in events if e.name == 'stale_data'] == []